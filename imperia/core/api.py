@@ -4,9 +4,10 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.contrib.auth.models import Group
 from core.models import Product
+from core.utils.roles import group_names
 
 def user_in_group(user, group_name: str) -> bool:
-    return user.is_authenticated and user.groups.filter(name=group_name).exists()
+    return group_name in group_names(user)
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
@@ -1,4 +1,5 @@
 from .permissions import user_in_allowed_groups
+from .utils.roles import group_names
 # core/context_processors.py
 
 def user_profile(request):
@@ -22,17 +23,12 @@ def nav_flags(request):
     """
     user = getattr(request, "user", None)
 
-    def in_groups(names):
-        return bool(
-            user
-            and user.is_authenticated
-            and user.groups.filter(name__in=names).exists()
-        )
-
-    is_operator = in_groups(["operator"])
-    is_manager = in_groups(["manager"])
-    is_director = in_groups(["director"])
-    is_warehouse = in_groups(["warehouse"])
+    # группы — одним запросом, общим с require_groups и проверками во view
+    names = group_names(user) if user else frozenset()
+    is_operator = "operator" in names
+    is_manager = "manager" in names
+    is_director = "director" in names
+    is_warehouse = "warehouse" in names
 
     # старый флаг совместимости — как было у тебя
     is_wh_or_director = (user.is_superuser if (user and user.is_authenticated) else False) \
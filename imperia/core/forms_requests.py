@@ -1,4 +1,6 @@
 # core/forms_requests.py
+from functools import lru_cache
+
 from django import forms
 from django.apps import apps
 from django.conf import settings
@@ -6,13 +8,16 @@ from django.db.models import ForeignKey
 
 from .models_requests import Request, RequestItem, RequestQuote, RequestQuoteItem, RequestShipment, RequestShipmentItem
 from .models import Counterparty, CounterpartyAddress, CounterpartyContact, Company
+from .utils.roles import group_names
 from django.forms import formset_factory
 
 
+@lru_cache(maxsize=None)
 def _counterparty_manager_is_user_fk() -> bool:
     """
     Проверяем, что Counterparty.manager — это ForeignKey на модель пользователя.
     Нужно, чтобы безопасно фильтровать контрагентов для менеджера.
+    Схема моделей за время жизни процесса не меняется — считаем один раз.
     """
     try:
         fld = Counterparty._meta.get_field("manager")
@@ -59,7 +64,7 @@ class RequestForm(forms.ModelForm):
         qs = Counterparty.objects.all()
 
         # менеджер видит только своих клиентов, если поле manager — FK на User
-        if user and user.groups.filter(name="manager").exists() and not user.is_superuser:
+        if user and "manager" in group_names(user) and not user.is_superuser:
             if _counterparty_manager_is_user_fk():
                 qs = qs.filter(manager=user)
 
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0044_alter_company_address_companyaddress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='counterpartycreaterequest',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='idx_cpreq_status_created'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:35
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0045_counterpartycreaterequest_status_created_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='counterparty',
+            name='search_vec',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('name', 'full_name', 'inn', config='simple'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='counterparty',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vec'], name='idx_counterparty_search_vec'),
+        ),
+    ]
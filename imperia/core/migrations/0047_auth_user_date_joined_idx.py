@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Индекс для keyset-пагинации списка сотрудников (ORDER BY date_joined DESC, id DESC).
+    auth_user — таблица contrib.auth, поэтому индекс создаём SQL-ом.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0046_counterparty_search_vec'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                "CREATE INDEX IF NOT EXISTS auth_user_date_joined_id_idx "
+                "ON auth_user (date_joined DESC, id DESC);"
+            ),
+            reverse_sql="DROP INDEX IF EXISTS auth_user_date_joined_id_idx;",
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Индекс (group_id, user_id) на auth_user_groups для фильтра сотрудников по роли
+    (EXISTS по группе). Таблица contrib.auth, поэтому индекс создаём SQL-ом.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0047_auth_user_date_joined_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                "CREATE INDEX IF NOT EXISTS auth_user_groups_group_user_idx "
+                "ON auth_user_groups (group_id, user_id);"
+            ),
+            reverse_sql="DROP INDEX IF EXISTS auth_user_groups_group_user_idx;",
+        ),
+    ]
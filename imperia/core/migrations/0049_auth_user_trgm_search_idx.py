@@ -0,0 +1,31 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Поля поиска в списке сотрудников (employee_list, Q(...__icontains=...)).
+USER_SEARCH_FIELDS = ("username", "first_name", "last_name", "email")
+
+
+class Migration(migrations.Migration):
+    """
+    Триграммные GIN-индексы для поиска сотрудников по подстроке.
+    icontains в PostgreSQL превращается в UPPER(col::text) LIKE UPPER('%q%'),
+    поэтому индексируем ровно это выражение — иначе планировщик индекс не возьмёт.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0048_auth_user_groups_group_user_idx'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+    ] + [
+        migrations.RunSQL(
+            sql=(
+                f"CREATE INDEX IF NOT EXISTS auth_user_{field}_trgm_idx "
+                f"ON auth_user USING gin (UPPER({field}::text) gin_trgm_ops);"
+            ),
+            reverse_sql=f"DROP INDEX IF EXISTS auth_user_{field}_trgm_idx;",
+        )
+        for field in USER_SEARCH_FIELDS
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:41
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции;
+    # зато индексы строятся без блокировки записи в таблицы
+    atomic = False
+
+    dependencies = [
+        ('core', '0049_auth_user_trgm_search_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='request',
+            index=models.Index(fields=['initiator', '-created_at'], name='req_init_ca_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='request',
+            index=models.Index(fields=['assignee', '-created_at'], name='req_assignee_ca_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='requesthistory',
+            index=models.Index(fields=['author', '-created_at'], name='reqhist_author_ca_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='stockmovement',
+            index=models.Index(fields=['actor', '-timestamp'], name='stockmove_actor_ts_idx'),
+        ),
+    ]
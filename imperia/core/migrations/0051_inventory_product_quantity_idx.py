@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-17 05:12
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY — без блокировки записи в остатки
+    atomic = False
+
+    dependencies = [
+        ('core', '0050_employee_activity_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['product', '-quantity'], name='inventory_prod_qty_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-17 05:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY — без блокировки записи в заявки
+    atomic = False
+
+    dependencies = [
+        ('core', '0051_inventory_product_quantity_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='request',
+            index=models.Index(fields=['status', '-created_at'], name='req_status_ca_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.14 on 2026-10-17 06:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY — без блокировки записи в листы сборки.
+    # Префиксный поиск по Product.barcode (LIKE 'q%') обслуживает индекс
+    # *_like (varchar_pattern_ops), который Django сам создаёт для unique-поля
+    atomic = False
+
+    dependencies = [
+        ('core', '0052_request_status_created_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='pickitem',
+            index=models.Index(fields=['request', 'barcode'], name='pickitem_req_barcode_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+# Поля поиска товара по подстроке (stock_lookup_by_name, Q(...__icontains=...)).
+PRODUCT_SEARCH_FIELDS = ("name", "sku", "brand", "vendor_code")
+
+
+class Migration(migrations.Migration):
+    """
+    Триграммные GIN-индексы для автодополнения товаров. Как и для сотрудников
+    (0049), индексируем выражение UPPER(col::text), в которое компилируется
+    icontains. Каталог большой — строим CONCURRENTLY, вне транзакции.
+    """
+    atomic = False
+
+    dependencies = [
+        ('core', '0053_product_barcode_prefix_pickitem_barcode_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS core_product_{field}_trgm_idx "
+                f"ON core_product USING gin (UPPER({field}::text) gin_trgm_ops);"
+            ),
+            reverse_sql=f"DROP INDEX CONCURRENTLY IF EXISTS core_product_{field}_trgm_idx;",
+        )
+        for field in PRODUCT_SEARCH_FIELDS
+    ]
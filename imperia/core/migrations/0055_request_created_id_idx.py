@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-17 07:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY — без блокировки записи в заявки
+    atomic = False
+
+    dependencies = [
+        ('core', '0054_product_trgm_search_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='request',
+            index=models.Index(fields=['-created_at', '-id'], name='req_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+# Поля поиска контрагента по подстроке (counterparty_list, Q(...__icontains=...)).
+COUNTERPARTY_SEARCH_FIELDS = ("name", "full_name", "inn")
+
+
+class Migration(migrations.Migration):
+    """
+    Триграммные GIN-индексы для поиска контрагентов по подстроке — в дополнение
+    к search_vec (тот находит только начала слов). Как и в 0054, индексируем
+    UPPER(col::text), в которое компилируется icontains. CONCURRENTLY, вне транзакции.
+    """
+    atomic = False
+
+    dependencies = [
+        ('core', '0056_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS core_counterparty_{field}_trgm_idx "
+                f"ON core_counterparty USING gin (UPPER({field}::text) gin_trgm_ops);"
+            ),
+            reverse_sql=f"DROP INDEX CONCURRENTLY IF EXISTS core_counterparty_{field}_trgm_idx;",
+        )
+        for field in COUNTERPARTY_SEARCH_FIELDS
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    product_barcode_prefix дублировал индекс core_product_barcode_*_like
+    (varchar_pattern_ops), который Django создаёт для unique-поля barcode.
+    Индекс убран из 0053; там, где 0053 уже применена в старом виде,
+    удаляем его здесь. CONCURRENTLY — вне транзакции.
+    """
+    atomic = False
+
+    dependencies = [
+        ('core', '0057_counterparty_trgm_search_idx'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="DROP INDEX CONCURRENTLY IF EXISTS product_barcode_prefix;",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.files.storage import default_storage
 from django.db.models.signals import pre_save, post_delete
 from django.dispatch import receiver
@@ -288,6 +290,14 @@ class Inventory(models.Model):
         verbose_name = "Остаток"
         verbose_name_plural = "Остатки"
         unique_together = ("warehouse", "bin", "product")
+        indexes = [
+            # ячейка с наибольшим остатком товара (stock_lookup)
+            models.Index(
+                fields=["product", "-quantity"],
+                condition=Q(quantity__gt=0),
+                name="inventory_prod_qty_idx",
+            ),
+        ]
 
     def __str__(self):
         place = self.bin.code if self.bin else "—"
@@ -321,6 +331,10 @@ class StockMovement(models.Model):
         verbose_name = "Движение товара"
         verbose_name_plural = "Движения товара"
         ordering = ["-timestamp", "id"]
+        indexes = [
+            # лента активности сотрудника (employee_detail)
+            models.Index(fields=["actor", "-timestamp"], name="stockmove_actor_ts_idx"),
+        ]
 
     def __str__(self):
         return f"{self.timestamp:%Y-%m-%d %H:%M} {self.movement_type} {self.product} x{self.quantity}"
@@ -376,11 +390,21 @@ class Counterparty(models.Model):
     # Сырой JSON с ЕГРЮЛ
     meta_json = models.JSONField("Данные из ЕГРЮЛ (сырые)", default=dict, blank=True)
 
+    # Поисковый вектор (название / полное название / ИНН) — считается в БД
+    search_vec = models.GeneratedField(
+        expression=SearchVector("name", "full_name", "inn", config="simple"),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
     class Meta:
         ordering = ["name"]
         permissions = [
             ("add_counterparty_by_inn", "Может добавлять контрагентов по ИНН"),
         ]
+        indexes = [
+            GinIndex(fields=["search_vec"], name="idx_counterparty_search_vec"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.inn})"
@@ -573,6 +597,10 @@ class CounterpartyCreateRequest(models.Model):
         ordering = ["-created_at"]
         verbose_name = "Заявка на добавление контрагента"
         verbose_name_plural = "Заявки на добавление контрагентов"
+        indexes = [
+            # keyset-пагинация очереди/списка заявок по (created_at, id)
+            models.Index(fields=["status", "-created_at", "-id"], name="idx_cpreq_status_created"),
+        ]
         constraints = [
             # Не допускаем дубликатов PENDING по одному ИНН
             models.UniqueConstraint(
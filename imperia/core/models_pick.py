@@ -28,6 +28,10 @@ class PickItem(models.Model):
 
     class Meta:
         ordering = ["id"]
+        indexes = [
+            # pick_confirm: строки листа сборки по штрихкодам
+            models.Index(fields=["request", "barcode"], name="pickitem_req_barcode_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         self.updated_at = timezone.now()
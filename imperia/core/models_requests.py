@@ -2,6 +2,7 @@
 from decimal import Decimal
 from django.conf import settings
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 import os
 from django.utils.translation import gettext_lazy as _
@@ -65,19 +66,36 @@ class Request(models.Model):
         ordering = ("-created_at",)
         verbose_name = "Заявка"
         verbose_name_plural = "Заявки"
+        indexes = [
+            # лента активности сотрудника (employee_detail)
+            models.Index(fields=["initiator", "-created_at"], name="req_init_ca_idx"),
+            models.Index(fields=["assignee", "-created_at"], name="req_assignee_ca_idx"),
+            # список заявок склада: фильтр по статусам + свежие сверху
+            models.Index(fields=["status", "-created_at"], name="req_status_ca_idx"),
+            # общий список операторов/директора: свежие сверху, без фильтра статуса
+            models.Index(fields=["-created_at", "-id"], name="req_created_id_idx"),
+        ]
 
     def __str__(self):
         return f"#{self.number or self.pk} {self.title}"
 
+    EDITABLE_STATUSES = frozenset({RequestStatus.DRAFT, RequestStatus.SUBMITTED, RequestStatus.REJECTED})
+    ITEMS_LOCKED_STATUSES = frozenset({RequestStatus.DONE, RequestStatus.CANCELED, RequestStatus.DELIVERED})
+
     @property
     def is_editable(self) -> bool:
         """Можно ли редактировать заявку (только в начальных статусах)"""
-        return self.status in {RequestStatus.DRAFT, RequestStatus.SUBMITTED, RequestStatus.REJECTED}
+        return self.status in self.EDITABLE_STATUSES
+
+    @classmethod
+    def editable_filter(cls, prefix: str = "") -> Q:
+        """is_editable как условие для БД (prefix — путь к заявке, напр. "request__")."""
+        return Q(**{f"{prefix}status__in": cls.EDITABLE_STATUSES})
     
     @property
     def can_add_items(self) -> bool:
         """Могут ли оператор/директор добавлять товары (в любой момент кроме завершенных/отмененных)"""
-        return self.status not in {RequestStatus.DONE, RequestStatus.CANCELED, RequestStatus.DELIVERED}
+        return self.status not in self.ITEMS_LOCKED_STATUSES
     
     @property
     def active_quote(self):
@@ -147,6 +165,12 @@ class RequestHistory(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     note = models.CharField(max_length=255, blank=True, default="")
 
+    class Meta:
+        indexes = [
+            # лента активности сотрудника (employee_detail)
+            models.Index(fields=["author", "-created_at"], name="reqhist_author_ca_idx"),
+        ]
+
 # --- Коммерческие предложения (вложения) ---
 
 
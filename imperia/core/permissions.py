@@ -3,19 +3,20 @@ from functools import wraps
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseForbidden
 from django.contrib.auth.decorators import permission_required
+from .utils.roles import group_names
 
 ALLOWED_GROUPS = {"warehouse", "director"}
 
 def user_in_allowed_groups(user) -> bool:
     if not user.is_authenticated:
         return False
-    return user.is_superuser or user.groups.filter(name__in=ALLOWED_GROUPS).exists()
+    return user.is_superuser or not group_names(user).isdisjoint(ALLOWED_GROUPS)
 
 def warehouse_or_director_required(view_func):
     return permission_required('core.view_product', raise_exception=True)(view_func)
 
 def user_in_groups(user, *groups):
-    return user.is_superuser or user.groups.filter(name__in=groups).exists()
+    return user.is_superuser or not group_names(user).isdisjoint(groups)
 
 def require_groups(*groups):
     """
@@ -3,16 +3,32 @@ import json
 import requests
 from decimal import Decimal
 
+from django.core.cache import cache
+
 
 BASE_INFO_URL = "https://egrul.itsoft.ru/{inn}.json"
 BASE_FIN_URL  = "https://egrul.itsoft.ru/fin/?{inn}"
 
 DEFAULT_TIMEOUT = 8  # сек
 
+# Данные ЕГРЮЛ меняются редко (финансы — раз в отчётный период),
+# поэтому ответы сервиса кэшируем по ИНН.
+INFO_CACHE_TTL = 60 * 60 * 24  # сутки
+FIN_CACHE_TTL = 60 * 60 * 6    # 6 часов
+
 class EgrulError(RuntimeError):
     pass
 
-def fetch_by_inn(inn: str) -> dict:
+def _cache_key(kind: str, inn: str) -> str:
+    return f"egrul:{kind}:{inn}"
+
+def fetch_by_inn(inn: str, force_refresh: bool = False) -> dict:
+    key = _cache_key("info", inn)
+    if not force_refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
     url = BASE_INFO_URL.format(inn=inn)
     try:
         r = requests.get(url, timeout=DEFAULT_TIMEOUT)
@@ -20,10 +36,12 @@ def fetch_by_inn(inn: str) -> dict:
         data = r.json()
         if not data:
             raise EgrulError("Пустой ответ ЕГРЮЛ")
-        return data
     except requests.RequestException as e:
         raise EgrulError(f"Ошибка запроса ЕГРЮЛ: {e}") from e
 
+    cache.set(key, data, INFO_CACHE_TTL)
+    return data
+
 def _get(d: dict, *path, default=""):
     cur = d
     for p in path:
@@ -169,13 +187,20 @@ def _to_dec(v):
         except Exception:
             return None
 
-def fetch_finance_by_inn(inn: str):
+def fetch_finance_by_inn(inn: str, force_refresh: bool = False):
     """
     Возвращает кортеж: (fin_json, revenue_last, profit_last)
     - fin_json: исходный JSON (dict), как пришёл с сервера
     - revenue_last: Decimal | None  (income за последний год)
     - profit_last:  Decimal | None  (income - outcome за последний год)
+    force_refresh=True — игнорировать кэш и перезаписать его свежими данными.
     """
+    key = _cache_key("fin", inn)
+    if not force_refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
     url = f"https://egrul.itsoft.ru/fin/?{inn}"
     try:
         resp = requests.get(url, timeout=10)
@@ -221,4 +246,6 @@ def fetch_finance_by_inn(inn: str):
             if inc is not None and out is not None:
                 profit_last = inc - out
 
-    return data, revenue_last, profit_last
+    result = (data, revenue_last, profit_last)
+    cache.set(key, result, FIN_CACHE_TTL)
+    return result
@@ -17,6 +17,19 @@ from .models_requests import Request as RequestModel, RequestHistory as RequestH
 from django.utils import timezone
 # =======================================================================
 
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from .models import Inventory, Product, ProductPrice, StockMovement
+from .utils.roles import ROLES_CACHE_KEY
+from .utils.caches import (
+    reset_employee_detail_cache, reset_stock_lookup_cache, reset_stock_lookup_name_cache,
+)
+
+User = get_user_model()
+
 
 def _remove_file(f):
     """Безопасно удалить файл на диске, если он существует."""
@@ -145,4 +158,81 @@ def replace_quote_file_cleanup(sender, instance: RequestQuote, **kwargs):
     except sender.DoesNotExist:
         return
     if old and old != instance.file:
-        old.delete(save=False)
\ No newline at end of file
+        old.delete(save=False)
+
+
+# Список ролей для фильтров кэшируется — сбрасываем при изменении групп
+# (после COMMIT, чтобы не закэшировать список до изменения)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def reset_role_list_cache(sender, **kwargs):
+    transaction.on_commit(lambda: cache.delete(ROLES_CACHE_KEY))
+
+
+# Карточка сотрудника (employee_detail) кэшируется — сбрасываем её при
+# изменении самого сотрудника, его роли и его заявок/истории/движений
+def _reset_employee_detail(*user_ids):
+    reset_employee_detail_cache(*user_ids)
+
+
+@receiver(post_save, sender=RequestModel)
+@receiver(post_delete, sender=RequestModel)
+def reset_employee_detail_on_request(sender, instance, **kwargs):
+    _reset_employee_detail(instance.initiator_id, instance.assignee_id)
+
+
+@receiver(post_save, sender=RequestHistoryModel)
+@receiver(post_delete, sender=RequestHistoryModel)
+def reset_employee_detail_on_history(sender, instance, **kwargs):
+    _reset_employee_detail(instance.author_id)
+
+
+@receiver(post_save, sender=StockMovement)
+@receiver(post_delete, sender=StockMovement)
+def reset_employee_detail_on_movement(sender, instance, **kwargs):
+    _reset_employee_detail(instance.actor_id)
+
+
+@receiver(post_save, sender=User)
+def reset_employee_detail_on_user(sender, instance, **kwargs):
+    _reset_employee_detail(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def reset_employee_detail_on_profile(sender, instance, **kwargs):
+    _reset_employee_detail(instance.user_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def reset_employee_detail_on_groups(sender, instance, reverse, pk_set, **kwargs):
+    if reverse:
+        _reset_employee_detail(*(pk_set or ()))
+    else:
+        _reset_employee_detail(instance.pk)
+
+
+# Ответы stock_lookup (по ШК) и автодополнения по названию кэшируются —
+# сбрасываем при изменении товара, его остатков и цен
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def reset_stock_lookup_on_product(sender, instance, **kwargs):
+    reset_stock_lookup_name_cache()
+    reset_stock_lookup_cache(instance.barcode)
+
+
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+@receiver(post_save, sender=ProductPrice)
+@receiver(post_delete, sender=ProductPrice)
+def reset_stock_lookup_on_stock(sender, instance, **kwargs):
+    reset_stock_lookup_name_cache()
+    if sender.product.is_cached(instance):
+        barcode = instance.product.barcode
+    else:
+        barcode = (
+            Product.objects.filter(pk=instance.product_id)
+            .values_list("barcode", flat=True).first()
+        )
+    reset_stock_lookup_cache(barcode)
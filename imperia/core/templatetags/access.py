@@ -1,5 +1,7 @@
 from django import template
 
+from ..utils.roles import group_names
+
 register = template.Library()
 
 @register.filter(name="in_groups")
@@ -12,4 +14,4 @@ def in_groups(user, groups_csv: str) -> bool:
     if getattr(user, "is_superuser", False):
         return True
     names = [g.strip() for g in groups_csv.split(",") if g.strip()]
-    return user.groups.filter(name__in=names).exists()
+    return not group_names(user).isdisjoint(names)
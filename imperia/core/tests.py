@@ -1,3 +1,182 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils.http import urlsafe_base64_encode
+
+from .models_pick import PickItem
+from .models_requests import Request, RequestHistory, RequestStatus
+from .utils.caches import employee_detail_cache_key
+from .utils.history import write_history
+from .utils.pagination import decode_cursor, encode_cursor, keyset_paginate
+from .views_pick import _sync_pick_items
+
+User = get_user_model()
+
+
+class CursorTests(TestCase):
+    """Кодирование курсора keyset-пагинации (?after=)."""
+
+    def test_round_trip(self):
+        ts = datetime(2026, 10, 17, 12, 30, 45, 123456, tzinfo=dt_timezone.utc)
+        self.assertEqual(decode_cursor(encode_cursor(ts, 42)), (ts, 42))
+
+    def test_invalid_cursor_is_none(self):
+        bad = [
+            "",
+            "не-base64!",
+            urlsafe_base64_encode(b"no-separator"),
+            urlsafe_base64_encode(b"not-a-date|5"),
+            urlsafe_base64_encode(b"2026-10-17T12:00:00+00:00|abc"),
+            urlsafe_base64_encode(b"\xff\xfe|1"),
+        ]
+        for cursor in bad:
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+
+
+class KeysetPaginateTests(TestCase):
+    """keyset_paginate на заявках: порядок (-created_at, -id), границы страниц."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("pager")
+        requests = [Request.objects.create(title=f"R{i}", initiator=cls.user) for i in range(5)]
+        # у трёх заявок одинаковое время — порядок решает id
+        same = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        Request.objects.filter(pk__in=[r.pk for r in requests[1:4]]).update(created_at=same)
+        cls.expected = list(
+            Request.objects.order_by("-created_at", "-id").values_list("pk", flat=True)
+        )
+
+    def _walk(self, per_page):
+        pages, cursor = [], None
+        while True:
+            page = keyset_paginate(Request.objects.all(), cursor, per_page)
+            pages.append(page)
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_cover_all_rows_once_with_ties(self):
+        for per_page in (1, 2, 3, 5, 10):
+            with self.subTest(per_page=per_page):
+                pages = self._walk(per_page)
+                pks = [r.pk for p in pages for r in p.object_list]
+                self.assertEqual(pks, self.expected)
+
+    def test_first_and_last_page(self):
+        pages = self._walk(2)
+        self.assertTrue(pages[0].is_first)
+        self.assertTrue(all(not p.is_first for p in pages[1:]))
+        self.assertTrue(all(p.has_next for p in pages[:-1]))
+        self.assertFalse(pages[-1].has_next)
+        self.assertEqual(pages[-1].next_cursor, "")
+
+    def test_exact_fit_has_no_next_page(self):
+        page = keyset_paginate(Request.objects.all(), None, len(self.expected))
+        self.assertFalse(page.has_next)
+        self.assertEqual(len(page.object_list), len(self.expected))
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        page = keyset_paginate(Request.objects.all(), "мусор", 2)
+        self.assertTrue(page.is_first)
+        self.assertEqual([r.pk for r in page.object_list], self.expected[:2])
+
+
+class SyncPickItemsTests(TestCase):
+    """_sync_pick_items: лист сборки приводится к новым строкам по разнице."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("picker")
+
+    def setUp(self):
+        self.req = Request.objects.create(title="Сборка", initiator=self.user)
+
+    @staticmethod
+    def _row(barcode, name, qty=1, price=0):
+        return {"barcode": barcode, "name": name, "location": "", "unit": "шт", "qty": qty, "price": price}
+
+    def test_diff_keeps_progress_of_unchanged_rows(self):
+        _sync_pick_items(self.req, [self._row("A", "Болт"), self._row("B", "Гайка"), self._row("C", "Шайба")])
+        a = PickItem.objects.get(request=self.req, barcode="A")
+        a.picked_qty, a.note = 1, "на полке"
+        a.save()
+        b_updated_at = PickItem.objects.get(request=self.req, barcode="B").updated_at
+
+        _sync_pick_items(self.req, [
+            self._row("A", "Болт"),                  # без изменений
+            self._row("B", "Гайка М8", price="2.5"),  # изменена
+            self._row("D", "Винт", qty=3),            # новая; C удаляется
+        ])
+
+        rows = {pi.barcode: pi for pi in PickItem.objects.filter(request=self.req)}
+        self.assertEqual(set(rows), {"A", "B", "D"})
+        self.assertEqual(rows["A"].pk, a.pk)
+        self.assertEqual((rows["A"].picked_qty, rows["A"].note), (1, "на полке"))
+        self.assertEqual((rows["B"].name, rows["B"].price), ("Гайка М8", Decimal("2.50")))
+        self.assertGreater(rows["B"].updated_at, b_updated_at)
+        self.assertEqual(rows["D"].qty, 3)
+
+    def test_duplicate_barcodes_are_matched_in_order(self):
+        _sync_pick_items(self.req, [self._row("X", "Первая"), self._row("X", "Вторая")])
+        first, second = PickItem.objects.filter(request=self.req).order_by("id")
+
+        _sync_pick_items(self.req, [self._row("X", "Первая")])
+
+        self.assertEqual(list(PickItem.objects.filter(request=self.req).values_list("pk", flat=True)), [first.pk])
+
+
+class EmployeeDetailCacheTests(TestCase):
+    """Кэш карточки сотрудника сбрасывается после COMMIT при изменениях."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("boss", password="x")
+        cls.employee = User.objects.create_user("worker")
+
+    def setUp(self):
+        cache.delete(employee_detail_cache_key(self.employee.pk))
+        self.client.force_login(self.admin)
+        self.url = reverse("core:employee_detail", args=[self.employee.pk])
+
+    def _cached(self):
+        return cache.get(employee_detail_cache_key(self.employee.pk))
+
+    def test_response_is_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._cached(), response.content)
+
+    def test_request_save_resets_after_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Request.objects.create(title="Новая", initiator=self.employee)
+        self.assertIsNone(self._cached())
+
+        response = self.client.get(self.url)
+        self.assertIn("Новая".encode(), response.content)
+
+    def test_reset_waits_for_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.employee.first_name = "Иван"
+            self.employee.save()
+            self.assertIsNotNone(self._cached())
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(self._cached())
 
-# Create your tests here.
+    def test_write_history_resets_author_card(self):
+        req = Request.objects.create(title="Заявка", initiator=self.admin)
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            write_history(RequestHistory(
+                request_id=req.pk, author_id=self.employee.pk,
+                from_status=RequestStatus.DRAFT, to_status=RequestStatus.SUBMITTED,
+            ))
+        self.assertIsNone(self._cached())
@@ -1,6 +1,8 @@
 from django.contrib.auth.decorators import user_passes_test
 from django.urls import reverse_lazy
 
+from .roles import group_names as user_group_names
+
 def group_required(*group_names, login_url="login"):
     """
     Использование:
@@ -14,6 +16,6 @@ def group_required(*group_names, login_url="login"):
             return False
         if user.is_superuser:
             return True
-        return user.groups.filter(name__in=group_names).exists()
+        return not user_group_names(user).isdisjoint(group_names)
 
     return user_passes_test(check, login_url=reverse_lazy(login_url))
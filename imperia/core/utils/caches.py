@@ -0,0 +1,66 @@
+# core/utils/caches.py
+"""
+Ключи кэша и их сброс: общие для view (чтение/запись) и сигналов (сброс).
+Кэш один на все воркеры (settings.CACHES); сброс — после COMMIT: если удалить
+ключ внутри транзакции, параллельный запрос успеет закэшировать старые данные.
+Вне транзакции on_commit выполняется сразу.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+# --- Карточка сотрудника (employee_detail) ---
+def employee_detail_cache_key(pk) -> str:
+    return f"employee_detail:{pk}"
+
+
+def reset_employee_detail_cache(*user_ids):
+    keys = {employee_detail_cache_key(pk) for pk in user_ids if pk}
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(list(keys)))
+
+
+# --- Автозаполнение по ШК (stock_lookup) ---
+def stock_lookup_cache_key(barcode) -> str:
+    return f"stock_lookup:{barcode}"
+
+
+def reset_stock_lookup_cache(barcode):
+    if barcode:
+        transaction.on_commit(lambda: cache.delete(stock_lookup_cache_key(barcode)))
+
+
+# --- Автодополнение по названию (stock_lookup_by_name) ---
+# Ключи содержат «поколение» — при изменении товаров/остатков/цен сигнал его
+# увеличивает, и все старые ответы разом перестают читаться
+STOCK_NAME_GEN_KEY = "stock_lookup_name:gen"
+
+
+def _new_stock_name_gen() -> int:
+    # Если ключ поколения вытеснен из кэша, начинаем с текущего времени в мс,
+    # а не с 1 — иначе снова читались бы старые ответы прежних поколений
+    return time.time_ns() // 1_000_000
+
+
+def stock_lookup_name_cache_key(query) -> str:
+    gen = cache.get(STOCK_NAME_GEN_KEY)
+    if gen is None:
+        gen = _new_stock_name_gen()
+        if not cache.add(STOCK_NAME_GEN_KEY, gen, None):
+            gen = cache.get(STOCK_NAME_GEN_KEY, gen)
+    digest = hashlib.md5(query.lower().encode()).hexdigest()
+    return f"stock_lookup_name:{gen}:{digest}"
+
+
+def _bump_stock_name_gen():
+    try:
+        cache.incr(STOCK_NAME_GEN_KEY)
+    except ValueError:
+        cache.set(STOCK_NAME_GEN_KEY, _new_stock_name_gen(), None)
+
+
+def reset_stock_lookup_name_cache():
+    transaction.on_commit(_bump_stock_name_gen)
@@ -0,0 +1,12 @@
+# core/utils/history.py
+from ..models_requests import RequestHistory
+from .caches import reset_employee_detail_cache
+
+
+def write_history(*rows):
+    """
+    Записи истории заявки одним INSERT. bulk_create не шлёт post_save,
+    поэтому кэш карточек авторов (employee_detail) сбрасываем здесь.
+    """
+    RequestHistory.objects.bulk_create(rows)
+    reset_employee_detail_cache(*(r.author_id for r in rows))
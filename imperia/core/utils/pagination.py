@@ -0,0 +1,56 @@
+# core/utils/pagination.py
+"""
+Keyset-пагинация по (дата, id) для списков, отсортированных от новых
+к старым: без COUNT(*) и без OFFSET — каждая страница стоит одинаково,
+сколько бы записей ни было пролистано.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    return urlsafe_base64_encode(f"{created_at.isoformat()}|{pk}".encode())
+
+
+def decode_cursor(cursor: str):
+    """Возвращает (created_at, pk) или None, если курсор битый."""
+    try:
+        ts, pk = urlsafe_base64_decode(cursor).decode().split("|", 1)
+        return datetime.fromisoformat(ts), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+@dataclass
+class KeysetPage:
+    object_list: list
+    has_next: bool
+    next_cursor: str
+    is_first: bool
+
+
+def keyset_paginate(qs, cursor, per_page: int, field: str = "created_at") -> KeysetPage:
+    """
+    qs сортируется по (-field, -id).
+    cursor — значение GET-параметра "after" (или None для первой страницы).
+    """
+    qs = qs.order_by(f"-{field}", "-id")
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded:
+        ts, pk = decoded
+        qs = qs.filter(Q(**{f"{field}__lt": ts}) | Q(**{field: ts, "pk__lt": pk}))
+
+    # берём на одну запись больше — так узнаём, есть ли следующая страница
+    rows = list(qs[: per_page + 1])
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = encode_cursor(getattr(rows[-1], field), rows[-1].pk) if has_next else ""
+    return KeysetPage(
+        object_list=rows,
+        has_next=has_next,
+        next_cursor=next_cursor,
+        is_first=decoded is None,
+    )
@@ -1,4 +1,35 @@
-def is_manager(user):    return user.is_authenticated and user.groups.filter(name="manager").exists()
-def is_operator(user):   return user.is_authenticated and user.groups.filter(name="operator").exists()
-def is_director(user):   return user.is_authenticated and user.groups.filter(name="director").exists()
-def can_review(user):    return is_operator(user) or is_director(user)
\ No newline at end of file
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+ROLES_CACHE_KEY = "roles:v1"
+# сек; при изменении групп ключ сбрасывается сигналом. Кэш общий для всех
+# воркеров (settings.CACHES), так что сброс виден каждому процессу
+ROLES_CACHE_TTL = 300
+
+def group_names(user):
+    """
+    Имена групп пользователя одним запросом; результат запоминается на объекте
+    пользователя — в пределах запроса повторные проверки ролей в БД не ходят.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    names = getattr(user, "_group_names_cache", None)
+    if names is None:
+        names = frozenset(user.groups.values_list("name", flat=True))
+        user._group_names_cache = names
+    return names
+
+
+def is_manager(user):    return "manager" in group_names(user)
+def is_operator(user):   return "operator" in group_names(user)
+def is_director(user):   return "director" in group_names(user)
+def can_review(user):    return is_operator(user) or is_director(user)
+
+
+def role_list():
+    """Список ролей [{"id", "name"}] по имени — для фильтров; кэшируется."""
+    return cache.get_or_set(
+        ROLES_CACHE_KEY,
+        lambda: list(Group.objects.order_by("name").values("id", "name")),
+        ROLES_CACHE_TTL,
+    )
@@ -23,6 +23,7 @@ from .forms import (
 from .models import Profile, Warehouse, StorageBin, Inventory, Product, StockMovement
 from .permissions import warehouse_or_director_required
 from .utils.auth import group_required   # <-- единственный нужный импорт
+from .utils.roles import group_names
 from .widgets import AvatarInput
 from django.views.decorators.http import require_http_methods
 from .forms import ProductInlineCreateForm
@@ -62,7 +63,7 @@ ROLE_TO_URL = {
 
 def in_group(group_name):
     def check(user):
-        return user.is_authenticated and user.groups.filter(name=group_name).exists()
+        return group_name in group_names(user)
     return check
 
 
@@ -142,8 +143,9 @@ def profile_view(request):
 
 @login_required
 def post_login_router(request: HttpRequest):
+    user_groups = group_names(request.user)
     for role, url_name in ROLE_TO_URL.items():
-        if request.user.groups.filter(name=role).exists():
+        if role in user_groups:
             return redirect(url_name)
     return render(request, "no_role.html")
 
@@ -394,7 +396,7 @@ def home(request):
 
 
 def _in_groups(user, names):
-    return user.is_authenticated and user.groups.filter(name__in=names).exists()
+    return not group_names(user).isdisjoint(names)
 
 def product_detail_json(request, pk: int):
     try:
@@ -943,9 +945,7 @@ def bin_delete(request, warehouse_pk: int, bin_pk: int):
 
 # --------------------- CRUD продуктов ---------------------
 def _can_see_prices(user) -> bool:
-    return user.is_authenticated and user.groups.filter(
-        name__in=["operator", "director"]
-    ).exists()
+    return not group_names(user).isdisjoint(("operator", "director"))
 
 def product_card(request, pk: int):
     product = get_object_or_404(Product, pk=pk)
@@ -987,10 +987,7 @@ def product_card(request, pk: int):
             })
 
     # ---- ПРАВА НА ЦЕНЫ ----
-    can_prices = (
-        request.user.is_authenticated
-        and request.user.groups.filter(name__in=["operator", "director"]).exists()
-    )
+    can_prices = _can_see_prices(request.user)
 
     # ---- ЦЕНЫ ----
     prices = []
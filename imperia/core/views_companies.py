@@ -10,12 +10,13 @@ from django.views.decorators.http import require_GET, require_http_methods, requ
 from .forms_companies import CompanyForm, CompanyAddressFormSet
 from .models import Company
 from .services.egrul import EgrulError, fetch_by_inn, parse_counterparty_payload
+from .utils.roles import group_names
 
 
 def _is_director(user):
     """Проверка, что пользователь является директором"""
     return user.is_authenticated and (
-        user.is_superuser or user.groups.filter(name="director").exists()
+        user.is_superuser or "director" in group_names(user)
     )
 
 
@@ -2,16 +2,30 @@
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.postgres.search import SearchQuery
 from django.db.models import Q
 from django.http import (
     JsonResponse,
+    HttpResponse,
     HttpResponseBadRequest,
     HttpResponseForbidden,
+    StreamingHttpResponse,
 )
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import get_template, render_to_string
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, set_response_etag
+from django.views.decorators.cache import cache_control
 from django.views.decorators.http import require_GET, require_POST, require_http_methods
-import json
+from itertools import islice
+import logging
+import os
+import re
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .services.egrul import (
     EgrulError,
@@ -38,13 +52,14 @@ from .forms import (
     # комментарий к заявке на удаление (для оператора)
     CounterpartyDeletionRequestForm,
 )
+from .utils.roles import group_names
 
 # ============================================================
 # Helpers (права)
 # ============================================================
 
 def _in_groups(user, names):
-    return user.is_authenticated and user.groups.filter(name__in=names).exists()
+    return not group_names(user).isdisjoint(names)
 
 def _is_operator_or_director(user):
     return _in_groups(user, ["operator", "director"])
@@ -70,6 +85,9 @@ def _is_attached_manager(user, counterparty: Counterparty):
 # Создание / автоподбор по ИНН
 # ============================================================
 
+# ИНН: 10 цифр (юрлицо) или 12 цифр (ИП/физлицо)
+_INN_RE = re.compile(r"[0-9]{10}(?:[0-9]{2})?")
+
 @login_required
 @user_passes_test(_is_operator_or_director)
 def counterparty_create(request):
@@ -154,22 +172,32 @@ def counterparty_update(request, pk: int):
 @login_required
 # @user_passes_test(_is_operator_or_director)
 @require_GET
+@cache_control(private=True, max_age=30)
 def counterparty_lookup_inn(request):
     """
     AJAX: /counterparties/lookup/?inn=...
     Возвращаем «лёгкий» JSON для автозаполнения формы.
+    Некорректный ИНН отсекаем до сетевого запроса; повторные запросы
+    по тому же ИНН браузер закрывает из своего кэша (max-age), после —
+    перепроверяет по ETag от содержимого ответа: 304, пока данные ЕГРЮЛ
+    (серверный кэш services/egrul.py) не обновились.
     """
     inn = (request.GET.get("inn") or "").strip()
-    if not inn.isdigit() or len(inn) not in (10, 12):
+    if not _INN_RE.fullmatch(inn):
         return HttpResponseBadRequest("Некорректный ИНН")
 
     try:
         raw = fetch_by_inn(inn)
         payload = parse_counterparty_payload(raw)
         payload.pop("meta_json", None)
-        return JsonResponse({"ok": True, "data": payload})
+        response = JsonResponse({"ok": True, "data": payload})
+        set_response_etag(response)
+        return get_conditional_response(request, etag=response["ETag"], response=response)
     except EgrulError as e:
-        return JsonResponse({"ok": False, "error": str(e)}, status=502)
+        response = JsonResponse({"ok": False, "error": str(e)}, status=502)
+        # ошибку ЕГРЮЛ не кэшируем — следующий запрос должен уйти в сервис
+        patch_cache_control(response, no_store=True)
+        return response
 
 # ============================================================
 # Детальная / финансы
@@ -213,7 +241,8 @@ def counterparty_detail(request, pk: int):
 def counterparty_refresh_finance(request, pk: int):
     obj = get_object_or_404(Counterparty, pk=pk)
     try:
-        fin_json, revenue, profit = fetch_finance_by_inn(obj.inn)
+        # кнопка «Обновить» — всегда идём в сервис, минуя кэш
+        fin_json, revenue, profit = fetch_finance_by_inn(obj.inn, force_refresh=True)
         # Гарантируем, что fin_json всегда будет словарем, а не None
         if fin_json is None:
             fin_json = {}
@@ -472,7 +501,11 @@ def counterparty_manager_remove(request, pk: int, user_id: int):
     obj = get_object_or_404(Counterparty, pk=pk)
     User = get_user_model()
     user = get_object_or_404(User, pk=user_id)
-    obj.managers.remove(user)
+    # один DELETE по through-таблице вместо SELECT + DELETE у managers.remove();
+    # обработчиков m2m_changed для managers нет
+    Counterparty.managers.through.objects.filter(
+        counterparty_id=obj.pk, user_id=user.pk
+    ).delete()
     messages.success(
         request,
         f"Менеджер «{user.get_full_name() or user.username}» снят с контрагента.",
@@ -483,37 +516,78 @@ def counterparty_manager_remove(request, pk: int, user_id: int):
 # Список клиентов
 # ============================================================
 
+_COUNTERPARTY_ROWS_SLOT = "<!--counterparty-rows-->"
+_COUNTERPARTY_LIST_CHUNK = 200
+_SEARCH_TERM_RE = re.compile(r"\w+")
+
 @login_required
 @user_passes_test(_is_ops_mgr_dir)
 def counterparty_list(request):
     """
     Видят operator/manager/director.
     Менеджер видит только контрагентов, к которым прикреплён.
-    Поиск по названию/пол. названию/ИНН.
+    Поиск по названию/пол. названию/ИНН (по подстроке и по префиксам слов).
     """
     q = (request.GET.get("q") or "").strip()
     qs = Counterparty.objects.all().prefetch_related("managers").order_by("name")
 
-    is_manager = request.user.groups.filter(name="manager").exists()
-    is_director = request.user.groups.filter(name="director").exists()
-    is_operator = request.user.groups.filter(name="operator").exists()
+    user_groups = group_names(request.user)
+    is_manager = "manager" in user_groups
+    is_director = "director" in user_groups
+    is_operator = "operator" in user_groups
 
     if is_manager and not (is_director or is_operator):
         qs = qs.filter(managers=request.user)
 
     if q:
-        qs = qs.filter(
-            Q(name__icontains=q) |
-            Q(full_name__icontains=q) |
-            Q(inn__icontains=q)
-        )
+        # Подстрока (как раньше: "машка" → "Ромашка", середина ИНН) — ILIKE
+        # по триграммным GIN-индексам (миграция 0057); плюс search_vec, где
+        # каждое слово ищется по префиксу в любом порядке ("ромашка ооо").
+        # Все ветки OR индексируемы — BitmapOr без полного просмотра таблицы
+        cond = Q(name__icontains=q) | Q(full_name__icontains=q) | Q(inn__icontains=q)
+        terms = _SEARCH_TERM_RE.findall(q)
+        if terms:
+            cond |= Q(search_vec=SearchQuery(
+                " & ".join(f"{t}:*" for t in terms), search_type="raw", config="simple",
+            ))
+        qs = qs.filter(cond)
+
+    # Страницу рендерим целиком без строк, а строки отдаём потоком порциями
+    # по курсору — список не материализуется в памяти целиком.
+    page = render_to_string(
+        "core/counterparty_list.html",
+        {"has_objects": qs.exists(), "q": q},
+        request=request,
+    )
+    head, sep, tail = page.partition(_COUNTERPARTY_ROWS_SLOT)
+    if not sep:
+        return HttpResponse(page)
+
+    rows_template = get_template("core/partials/counterparty_rows.html")
 
-    return render(request, "core/counterparty_list.html", {"objects": qs, "q": q})
+    def stream():
+        yield head
+        rows = qs.iterator(chunk_size=_COUNTERPARTY_LIST_CHUNK)
+        while chunk := list(islice(rows, _COUNTERPARTY_LIST_CHUNK)):
+            yield rows_template.render({"objects": chunk})
+        yield tail
+
+    return StreamingHttpResponse(stream())
 
 # ============================================================
 # Подсказки адресов через OSM Nominatim (бесплатно)
 # ============================================================
 
+logger = logging.getLogger(__name__)
+
+# Одна сессия на процесс: keep-alive и пул соединений к геосервисам,
+# без TLS-рукопожатия на каждое нажатие клавиши. Повторы не делаем —
+# у каждого источника есть свой fallback.
+_http = requests.Session()
+_http_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=Retry(total=0))
+_http.mount("https://", _http_adapter)
+_http.mount("http://", _http_adapter)
+
 @login_required
 @require_GET
 def address_suggest_osm(request):
@@ -531,13 +605,11 @@ def address_suggest_osm(request):
     # Попытка 1: Dadata API (если есть ключ) - лучший для российских адресов
     # Бесплатный тариф: до 10,000 запросов в день
     # Регистрация: https://dadata.ru/api/
-    import os
     dadata_token = os.getenv("DADATA_API_TOKEN")
     dadata_secret = os.getenv("DADATA_API_SECRET")
     
     if dadata_token:
         try:
-            import requests
             dadata_url = "https://suggestions.dadata.ru/suggestions/api/4_1/rs/suggest/address"
             headers = {
                 "Content-Type": "application/json",
@@ -554,7 +626,7 @@ def address_suggest_osm(request):
                 "locations": [{"country": "*"}],  # Ищем по всему миру, но приоритет России
             }
             
-            r = requests.post(dadata_url, json=payload, headers=headers, timeout=3)
+            r = _http.post(dadata_url, json=payload, headers=headers, timeout=3)
             r.raise_for_status()
             data = r.json()
             
@@ -565,20 +637,14 @@ def address_suggest_osm(request):
             ]
             
             if suggestions:
-                import logging
-                logger = logging.getLogger(__name__)
                 logger.info(f"Dadata API: найдено {len(suggestions)} подсказок для '{q}'")
                 return JsonResponse({"suggestions": suggestions})
         except Exception as e:
             # Продолжаем к другим источникам
-            import logging
-            logger = logging.getLogger(__name__)
             logger.warning(f"Dadata API error: {e}")
-            pass
     
     # Попытка 2: Photon API (бесплатный, без ключа, хорошо работает с адресами)
     try:
-        import requests
         # Photon API - бесплатный геокодер от Komoot
         # Пробуем несколько вариантов запроса для лучших результатов
         search_variants = [q]
@@ -588,7 +654,7 @@ def address_suggest_osm(request):
         
         for search_q in search_variants:
             url = f"https://photon.komoot.io/api/?q={requests.utils.quote(search_q)}&limit=10"
-            r = requests.get(url, timeout=3)
+            r = _http.get(url, timeout=3)
             if r.ok:
                 data = r.json()
                 if data.get("features"):
@@ -632,16 +698,11 @@ def address_suggest_osm(request):
                             break
                     
                     if suggestions:
-                        import logging
-                        logger = logging.getLogger(__name__)
                         logger.info(f"Photon API: найдено {len(suggestions)} подсказок для '{q}'")
                         return JsonResponse({"suggestions": suggestions})
                     break  # Если нашли результаты, не пробуем другие варианты
     except Exception as e:
-        import logging
-        logger = logging.getLogger(__name__)
         logger.warning(f"Photon API error: {e}")
-        pass
     
     # Попытка 3: Nominatim с улучшенными параметрами и разными вариантами запроса
     # Пробуем несколько вариантов запроса для лучших результатов
@@ -666,86 +727,64 @@ def address_suggest_osm(request):
         "User-Agent": "ImperiaApp/1.0 (admin@example.com)"
     }
 
-    try:
-        import requests
-        for query_variant in query_variants:
-            try:
-                params = {
-                    "q": query_variant,
-                    "format": "json",
-                    "addressdetails": 1,
-                    "limit": 10,
-                    "accept-language": "ru",
-                    "countrycodes": "ru",
-                }
-                
-                r = requests.get(
-                    "https://nominatim.openstreetmap.org/search",
-                    params=params,
-                    headers=headers,
-                    timeout=5,
-                )
-                r.raise_for_status()
-                data = r.json()
-                
-                if data:
-                    # Форматируем результаты лучше
-                    for item in data:
-                        display_name = item.get("display_name", "")
-                        if display_name:
-                            # Пробуем создать более читаемый адрес
-                            address = item.get("address", {})
-                            if address:
-                                parts = []
-                                if address.get("road"):
-                                    parts.append(address["road"])
-                                if address.get("house_number"):
-                                    parts.append(address["house_number"])
-                                if address.get("city") or address.get("town"):
-                                    city = address.get("city") or address.get("town")
-                                    if parts:
-                                        parts.append(f", {city}")
-                                    else:
-                                        parts.append(city)
-                                
+    for query_variant in query_variants:
+        try:
+            params = {
+                "q": query_variant,
+                "format": "json",
+                "addressdetails": 1,
+                "limit": 10,
+                "accept-language": "ru",
+                "countrycodes": "ru",
+            }
+            
+            r = _http.get(
+                "https://nominatim.openstreetmap.org/search",
+                params=params,
+                headers=headers,
+                timeout=5,
+            )
+            r.raise_for_status()
+            data = r.json()
+            
+            if data:
+                # Форматируем результаты лучше
+                for item in data:
+                    display_name = item.get("display_name", "")
+                    if display_name:
+                        # Пробуем создать более читаемый адрес
+                        address = item.get("address", {})
+                        if address:
+                            parts = []
+                            if address.get("road"):
+                                parts.append(address["road"])
+                            if address.get("house_number"):
+                                parts.append(address["house_number"])
+                            if address.get("city") or address.get("town"):
+                                city = address.get("city") or address.get("town")
                                 if parts:
-                                    formatted = " ".join(parts)
-                                    suggestions.append({"value": formatted})
+                                    parts.append(f", {city}")
                                 else:
-                                    suggestions.append({"value": display_name})
+                                    parts.append(city)
+                            
+                            if parts:
+                                formatted = " ".join(parts)
+                                suggestions.append({"value": formatted})
                             else:
                                 suggestions.append({"value": display_name})
-                            
-                            if len(suggestions) >= 5:
-                                break
-                    
-                    if suggestions:
-                        break  # Если нашли результаты, прекращаем поиск
+                        else:
+                            suggestions.append({"value": display_name})
+                        
+                        if len(suggestions) >= 5:
+                            break
                 
-                # Небольшая задержка между запросами
-                import time
-                time.sleep(0.5)
-            except Exception:
-                continue
-    except Exception:
-        pass
-    except Exception:
-        from urllib.parse import urlencode
-        from urllib.request import Request, urlopen
-
-        try:
-            url = "https://nominatim.openstreetmap.org/search?" + urlencode(params)
-            req = Request(url, headers=headers)
-            with urlopen(req, timeout=5) as resp:
-                raw = resp.read().decode("utf-8", "ignore")
-                data = json.loads(raw)
-                suggestions = [
-                    {"value": item.get("display_name", "")}
-                    for item in data[:5]
-                    if item.get("display_name")
-                ]
+                if suggestions:
+                    break  # Если нашли результаты, прекращаем поиск
+            
+            # Небольшая задержка между запросами
+            time.sleep(0.5)
         except Exception:
-            suggestions = []
+            continue
 
     return JsonResponse({"suggestions": suggestions})
 
@@ -907,19 +946,10 @@ def geocode_address(request):
         "Accept-Language": "ru-RU,ru;q=0.9"
     }
     
-    try:
-        import requests
-        use_requests = True
-    except ImportError:
-        use_requests = False
-        from urllib.parse import urlencode
-        from urllib.request import Request, urlopen
-    
     for i, search_query in enumerate(search_queries):
         try:
             # Задержка между попытками (кроме первой)
             if i > 0:
-                import time
                 time.sleep(0.5)
             
             params = {
@@ -934,21 +964,14 @@ def geocode_address(request):
             if i < len(search_queries) - 2:
                 params["countrycodes"] = "ru"
             
-            if use_requests:
-                r = requests.get(
-                    "https://nominatim.openstreetmap.org/search",
-                    params=params,
-                    headers=headers,
-                    timeout=5,
-                )
-                r.raise_for_status()
-                data = r.json()
-            else:
-                url = "https://nominatim.openstreetmap.org/search?" + urlencode(params)
-                req = Request(url, headers=headers)
-                with urlopen(req, timeout=5) as resp:
-                    raw = resp.read().decode("utf-8", "ignore")
-                    data = json.loads(raw)
+            r = _http.get(
+                "https://nominatim.openstreetmap.org/search",
+                params=params,
+                headers=headers,
+                timeout=5,
+            )
+            r.raise_for_status()
+            data = r.json()
             
             if data and len(data) > 0:
                 # Ищем результат в России (если возможно)
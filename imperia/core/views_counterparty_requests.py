@@ -1,5 +1,5 @@
-from django.db.models import Q
-from django.core.paginator import Paginator
+from django.db.models import CharField, Q, Value
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.shortcuts import get_object_or_404, redirect, render
@@ -7,6 +7,7 @@ from django.db import transaction
 from .forms import CounterpartyCreateRequestForm, CounterpartyCreateRequestDocFormSet
 from .models import CounterpartyCreateRequest
 from .utils.roles import is_manager, can_review
+from .utils.pagination import keyset_paginate
 from django.contrib.auth.decorators import login_required, user_passes_test
 try:
     from .utils.roles import is_operator, is_director, is_manager
@@ -75,9 +76,8 @@ def manager_counterparty_requests(request):
     if q:
         qs = qs.filter(Q(inn__icontains=q) | Q(name__icontains=q))
 
-    # Пагинация (по 18 карточек)
-    paginator = Paginator(qs, 18)
-    page_obj = paginator.get_page(request.GET.get("page"))
+    # Пагинация (по 18 карточек), keyset по (created_at, id)
+    page_obj = keyset_paginate(qs, request.GET.get("after"), 18)
 
     return render(
         request,
@@ -92,8 +92,13 @@ def manager_counterparty_requests(request):
 @login_required
 @user_passes_test(lambda u: is_operator(u) or is_director(u))
 def counterparty_review_queue(request):
+    # имя менеджера для карточки считаем в SQL (как User.get_full_name,
+    # с откатом на username) — шаблону не нужен объект manager целиком
     qs = (CounterpartyCreateRequest.objects
-          .select_related("manager")
+          .annotate(manager_name=Coalesce(
+              NullIf(Trim(Concat("manager__first_name", Value(" "), "manager__last_name")), Value("")),
+              "manager__username",
+          ))
           .order_by("-created_at"))
 
     # фильтры
@@ -104,12 +109,16 @@ def counterparty_review_queue(request):
         qs = qs.filter(status=status)
 
     if q:
-        qs = qs.filter(
+        # один LIKE по склеенной строке вместо трёх по полям менеджера
+        qs = qs.alias(manager_search=Concat(
+            "manager__username", Value(" "),
+            "manager__first_name", Value(" "),
+            "manager__last_name",
+            output_field=CharField(),
+        )).filter(
             Q(inn__icontains=q) |
             Q(name__icontains=q) |
-            Q(manager__username__icontains=q) |
-            Q(manager__first_name__icontains=q) |
-            Q(manager__last_name__icontains=q)
+            Q(manager_search__icontains=q)
         )
 
     # счетчик ожидающих — для бейджа в заголовке
@@ -117,9 +126,8 @@ def counterparty_review_queue(request):
         status=CounterpartyCreateRequest.Status.PENDING
     ).count()
 
-    # пагинация (по желанию)
-    paginator = Paginator(qs, 18)
-    page_obj = paginator.get_page(request.GET.get("page"))
+    # пагинация: keyset по (created_at, id), без COUNT(*) и OFFSET
+    page_obj = keyset_paginate(qs, request.GET.get("after"), 18)
 
     return render(
         request,
@@ -1,24 +1,74 @@
 # core/views_employees.py
+from types import MappingProxyType
+
+import orjson
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Q
-from django.http import JsonResponse
+from django.db.models import (
+    BigIntegerField, CharField, DecimalField, Exists, F, OuterRef, Q, Subquery, Value,
+)
+from django.db.models.functions import Cast
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.http import require_http_methods, require_POST
-from django.core.paginator import Paginator
 
 from .forms_employees import EmployeeForm
 from .models import Profile
+from .utils.caches import employee_detail_cache_key
+from .utils.pagination import keyset_paginate
+from .utils.roles import group_names, role_list
 
 User = get_user_model()
 
+# Подписи статусов заявок и типов движений для ленты активности
+STATUS_NAMES = MappingProxyType({
+    "draft": "Черновик",
+    "submitted": "Отправлена",
+    "approved": "Согласована",
+    "to_pick": "В сборку",
+    "in_progress": "Собирается",
+    "ready_to_ship": "Готова к отгрузке",
+    "delivered": "Доставлена",
+    "done": "Завершена",
+    "rejected": "Отклонена",
+    "canceled": "Отменена",
+})
+MOVEMENT_NAMES = MappingProxyType({
+    "IN": "Поступление",
+    "OUT": "Списание/Отгрузка",
+    "MOVE": "Перемещение",
+    "ADJ": "Корректировка",
+})
+
+# Колонки ленты активности сотрудника (общие для всех частей UNION ALL)
+_ACTIVITY_COLUMNS = ("kind", "ref_id", "ref_no", "txt1", "txt2", "txt3", "qty", "wh", "at")
+
+
+EMPLOYEE_DETAIL_CACHE_TTL = 60  # сек
+
+
+def _null(output_field):
+    """Типизированный NULL для UNION (нетипизированный NULL PostgreSQL выводит как text)."""
+    return Cast(Value(None), output_field)
+
+
+def _role_name():
+    """Роль сотрудника (первая группа, как groups.first()) — подзапросом, без prefetch групп."""
+    return Subquery(
+        User.groups.through.objects
+        .filter(user=OuterRef("pk"))
+        .order_by("group_id")
+        .values("group__name")[:1]
+    )
+
 
 def _is_director(user):
     """Проверка, что пользователь является директором"""
     return user.is_authenticated and (
-        user.is_superuser or user.groups.filter(name="director").exists()
+        user.is_superuser or "director" in group_names(user)
     )
 
 
@@ -26,7 +76,17 @@ def _is_director(user):
 @user_passes_test(_is_director)
 def employee_list(request):
     """Список всех сотрудников (исключая суперпользователей)"""
-    employees = User.objects.select_related("profile").prefetch_related("groups").filter(is_superuser=False).order_by("-date_joined")
+    # Роль — скалярным подзапросом (в карточке нужна одна), из профиля —
+    # только выводимые поля, без пароля и прочих колонок auth_user
+    employees = (
+        User.objects.select_related("profile")
+        .only(
+            "id", "username", "first_name", "last_name", "email", "is_active",
+            "date_joined", "last_login", "profile__phone", "profile__telegram",
+        )
+        .annotate(role_name=_role_name())
+        .filter(is_superuser=False)
+    )
     
     # Поиск
     search_query = request.GET.get("q", "").strip()
@@ -41,19 +101,20 @@ def employee_list(request):
     # Фильтр по роли
     role_filter = request.GET.get("role", "")
     if role_filter:
-        employees = employees.filter(groups__name=role_filter)
+        # полусоединение вместо JOIN по groups — без дублей строк и DISTINCT
+        employees = employees.filter(Exists(
+            User.groups.through.objects.filter(user=OuterRef("pk"), group__name=role_filter)
+        ))
     
-    # Пагинация
-    paginator = Paginator(employees, 20)
-    page_number = request.GET.get("page", 1)
-    page_obj = paginator.get_page(page_number)
+    # Пагинация: keyset по (date_joined, id), без COUNT(*) и OFFSET
+    page_obj = keyset_paginate(employees, request.GET.get("after"), 20, field="date_joined")
     
-    # Получаем список всех ролей для фильтра
-    from django.contrib.auth.models import Group
-    roles = Group.objects.all().order_by("name")
+    # Список всех ролей для фильтра (кэшируется, сбрасывается при изменении групп)
+    roles = role_list()
     
     return render(request, "core/employee_list.html", {
-        "employees": page_obj,
+        "employees": page_obj.object_list,
+        "page_obj": page_obj,
         "roles": roles,
         "search_query": search_query,
         "role_filter": role_filter,
@@ -164,8 +225,15 @@ def employee_detail(request, pk):
     from django.utils import timezone
     from datetime import timedelta
     
+    # Карточку открывают повторно — отдаём из кэша; сбрасывается сигналами
+    # при изменении сотрудника и его заявок/истории/движений (core/signals.py)
+    cache_key = employee_detail_cache_key(pk)
+    body = cache.get(cache_key)
+    if body is not None:
+        return HttpResponse(body, content_type="application/json")
+    
     user = get_object_or_404(
-        User.objects.select_related("profile").prefetch_related("groups"),
+        User.objects.select_related("profile").annotate(role_name=_role_name()),
         pk=pk
     )
     
@@ -174,88 +242,106 @@ def employee_detail(request, pk):
     except Profile.DoesNotExist:
         profile = None
     
-    role = user.groups.first()
     
-    # Собираем историю событий сотрудника
-    activities = []
-    
-    # 1. Созданные заявки
+    # Собираем историю событий сотрудника: четыре источника одним
+    # UNION ALL ... ORDER BY at DESC LIMIT 50 — сортирует и обрезает БД.
     from .models_requests import Request, RequestHistory
-    created_requests = Request.objects.filter(initiator=user).order_by("-created_at")[:20]
-    for req in created_requests:
-        activities.append({
-            "type": "request_created",
-            "icon": "📝",
-            "title": "Создана заявка",
-            "description": f"Заявка #{req.number or req.id}: {req.title}",
-            "date": req.created_at,
-            "link": f"/requests/{req.id}/",
-        })
-    
+    from .models import StockMovement
+
+    # 1. Созданные заявки
+    created_requests = (
+        Request.objects.filter(initiator=user)
+        .annotate(
+            kind=Value("request_created"), ref_id=F("id"), ref_no=F("number"),
+            txt1=F("title"), txt2=_null(CharField()), txt3=_null(CharField()),
+            qty=_null(DecimalField(max_digits=14, decimal_places=3)), wh=_null(CharField()), at=F("created_at"),
+        )
+        .order_by("-created_at")
+        .values_list(*_ACTIVITY_COLUMNS)[:20]
+    )
     # 2. История изменений заявок (где сотрудник был автором)
-    request_history = RequestHistory.objects.filter(author=user).select_related("request").order_by("-created_at")[:30]
-    for hist in request_history:
-        status_names = {
-            "draft": "Черновик",
-            "submitted": "Отправлена",
-            "approved": "Согласована",
-            "to_pick": "В сборку",
-            "in_progress": "Собирается",
-            "ready_to_ship": "Готова к отгрузке",
-            "delivered": "Доставлена",
-            "done": "Завершена",
-            "rejected": "Отклонена",
-            "canceled": "Отменена",
-        }
-        from_status = status_names.get(hist.from_status, hist.from_status) if hist.from_status else "—"
-        to_status = status_names.get(hist.to_status, hist.to_status)
-        
-        activities.append({
-            "type": "request_status_changed",
-            "icon": "🔄",
-            "title": "Изменен статус заявки",
-            "description": f"Заявка #{hist.request.number or hist.request.id}: {from_status} → {to_status}",
-            "note": hist.note if hist.note else "",
-            "date": hist.created_at,
-            "link": f"/requests/{hist.request.id}/",
-        })
-    
+    request_history = (
+        RequestHistory.objects.filter(author=user)
+        .annotate(
+            kind=Value("request_status_changed"), ref_id=F("request_id"), ref_no=F("request__number"),
+            txt1=F("from_status"), txt2=F("to_status"), txt3=F("note"),
+            qty=_null(DecimalField(max_digits=14, decimal_places=3)), wh=_null(CharField()), at=F("created_at"),
+        )
+        .order_by("-created_at")
+        .values_list(*_ACTIVITY_COLUMNS)[:30]
+    )
     # 3. Движения товаров на складе
-    from .models import StockMovement
-    stock_movements = StockMovement.objects.filter(actor=user).select_related("product", "warehouse").order_by("-timestamp")[:30]
-    movement_type_names = {
-        "IN": "Поступление",
-        "OUT": "Списание/Отгрузка",
-        "MOVE": "Перемещение",
-        "ADJ": "Корректировка",
-    }
-    for move in stock_movements:
-        type_name = movement_type_names.get(move.movement_type, move.movement_type)
-        activities.append({
-            "type": "stock_movement",
-            "icon": "📦",
-            "title": f"{type_name} товара",
-            "description": f"{move.product.name} × {move.quantity}",
-            "note": f"Склад: {move.warehouse.code}" + (f" • {move.note}" if move.note else ""),
-            "date": move.timestamp,
-            "link": None,
-        })
-    
+    stock_movements = (
+        StockMovement.objects.filter(actor=user)
+        .annotate(
+            kind=Value("stock_movement"), ref_id=_null(BigIntegerField()), ref_no=_null(CharField()),
+            txt1=F("movement_type"), txt2=F("product__name"), txt3=F("note"),
+            qty=F("quantity"), wh=F("warehouse__code"), at=F("timestamp"),
+        )
+        .order_by("-timestamp")
+        .values_list(*_ACTIVITY_COLUMNS)[:30]
+    )
     # 4. Назначенные заявки (где сотрудник ответственный)
-    assigned_requests = Request.objects.filter(assignee=user).order_by("-created_at")[:10]
-    for req in assigned_requests:
-        activities.append({
-            "type": "request_assigned",
-            "icon": "👤",
-            "title": "Назначена заявка",
-            "description": f"Заявка #{req.number or req.id}: {req.title}",
-            "date": req.updated_at,
-            "link": f"/requests/{req.id}/",
-        })
-    
-    # Сортируем все события по дате (новые сверху)
-    activities.sort(key=lambda x: x["date"], reverse=True)
-    activities = activities[:50]  # Ограничиваем до 50 последних событий
+    assigned_requests = (
+        Request.objects.filter(assignee=user)
+        .annotate(
+            kind=Value("request_assigned"), ref_id=F("id"), ref_no=F("number"),
+            txt1=F("title"), txt2=_null(CharField()), txt3=_null(CharField()),
+            qty=_null(DecimalField(max_digits=14, decimal_places=3)), wh=_null(CharField()), at=F("updated_at"),
+        )
+        .order_by("-created_at")
+        .values_list(*_ACTIVITY_COLUMNS)[:10]
+    )
+
+    feed = (
+        created_requests
+        .union(request_history, stock_movements, assigned_requests, all=True)
+        .order_by("-at")[:50]
+    )
+
+    activities = []
+    for kind, ref_id, ref_no, txt1, txt2, txt3, qty, wh, at in feed:
+        if kind == "request_created":
+            activities.append({
+                "type": kind,
+                "icon": "📝",
+                "title": "Создана заявка",
+                "description": f"Заявка #{ref_no or ref_id}: {txt1}",
+                "date": at,
+                "link": f"/requests/{ref_id}/",
+            })
+        elif kind == "request_status_changed":
+            from_status = STATUS_NAMES.get(txt1, txt1) if txt1 else "—"
+            to_status = STATUS_NAMES.get(txt2, txt2)
+            activities.append({
+                "type": kind,
+                "icon": "🔄",
+                "title": "Изменен статус заявки",
+                "description": f"Заявка #{ref_no or ref_id}: {from_status} → {to_status}",
+                "note": txt3 if txt3 else "",
+                "date": at,
+                "link": f"/requests/{ref_id}/",
+            })
+        elif kind == "stock_movement":
+            type_name = MOVEMENT_NAMES.get(txt1, txt1)
+            activities.append({
+                "type": kind,
+                "icon": "📦",
+                "title": f"{type_name} товара",
+                "description": f"{txt2} × {qty}",
+                "note": f"Склад: {wh}" + (f" • {txt3}" if txt3 else ""),
+                "date": at,
+                "link": None,
+            })
+        else:
+            activities.append({
+                "type": kind,
+                "icon": "👤",
+                "title": "Назначена заявка",
+                "description": f"Заявка #{ref_no or ref_id}: {txt1}",
+                "date": at,
+                "link": f"/requests/{ref_id}/",
+            })
     
     # Форматируем события для JSON
     activities_data = []
@@ -281,7 +367,7 @@ def employee_detail(request, pk):
         "is_active": user.is_active,
         "date_joined": user.date_joined.strftime("%d.%m.%Y %H:%M") if user.date_joined else "",
         "last_login": user.last_login.strftime("%d.%m.%Y %H:%M") if user.last_login else "Никогда",
-        "role": role.name if role else "Нет роли",
+        "role": user.role_name or "Нет роли",
         "phone": profile.phone if profile else "",
         "whatsapp": profile.whatsapp if profile else "",
         "telegram": profile.telegram if profile else "",
@@ -290,6 +376,9 @@ def employee_detail(request, pk):
         "activities": activities_data,
         "activities_count": len(activities_data),
     }
+    # orjson сериализует заметно быстрее json; в кэш кладём готовые байты
+    body = orjson.dumps(data)
+    cache.set(cache_key, body, EMPLOYEE_DETAIL_CACHE_TTL)
     
-    return JsonResponse(data)
+    return HttpResponse(body, content_type="application/json")
 
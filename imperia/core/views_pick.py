@@ -1,17 +1,28 @@
 from __future__ import annotations
 
+from decimal import Decimal
+from itertools import islice
+
 from django.contrib import messages
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Now
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.views.decorators.http import require_GET, require_POST
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import get_object_or_404
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
 from .permissions import require_groups
-from .models import Product, Inventory
+from .models import Product, Inventory, ProductPrice
 from .models_requests import Request, RequestStatus, RequestHistory
-import json
-from django.views.decorators.http import require_POST
+import orjson
 from django.db import transaction
 from .models_pick import PickItem, PickResult, PickResultItem
+from .utils.caches import (
+    reset_employee_detail_cache, stock_lookup_cache_key, stock_lookup_name_cache_key,
+)
+from .utils.history import write_history
 
 
 # --- формы (формсет сборки) ---
@@ -23,6 +34,40 @@ except Exception:
 # ----------------------------- #
 #     Автозаполнение по ШК      #
 # ----------------------------- #
+# Сканер часто присылает один и тот же ШК несколько раз подряд —
+# найденный товар кэшируем ненадолго в общем для воркеров кэше; сбрасывается
+# сигналами (core/signals.py). «Не найден» не кэшируем — только что
+# заведённый ШК должен находиться сразу
+STOCK_LOOKUP_CACHE_TTL = 15  # сек
+STOCK_LOOKUP_NOT_FOUND = {"ok": False, "error": "not_found"}
+
+
+# Автодополнение по названию: одни и те же префиксы набирают многие операторы.
+# Ключи с «поколением» (utils/caches.py) — сигнал увеличивает его при изменении
+# товаров/остатков/цен, и все старые ответы разом перестают читаться
+STOCK_NAME_CACHE_TTL = 60  # сек
+
+
+def _top_inventory(field):
+    """Поле строки остатка с наибольшим количеством товара (для annotate по Product)."""
+    return Subquery(
+        Inventory.objects
+        .filter(product=OuterRef("pk"), quantity__gt=0)
+        .order_by("-quantity", "id")
+        .values(field)[:1]
+    )
+
+
+def _contract_price():
+    """Цена закупки товара (contracts/contract) — для расчёта наценки."""
+    return Subquery(
+        ProductPrice.objects
+        .filter(product=OuterRef("pk"), price_type__in=["contracts", "contract"])
+        .order_by("pk")
+        .values("value")[:1]
+    )
+
+
 @require_GET
 @require_groups("operator", "director", "warehouse", "manager")
 def stock_lookup(request):
@@ -30,34 +75,42 @@ def stock_lookup(request):
     if not barcode:
         return JsonResponse({"ok": False, "error": "empty"}, status=400)
 
-    product = Product.objects.filter(barcode=barcode).first()
-    if not product:
-        return JsonResponse({"ok": False, "error": "not_found"}, status=404)
+    cache_key = stock_lookup_cache_key(barcode)
+    data = cache.get(cache_key)
+    if data is not None:
+        return JsonResponse(data)
 
-    inv = (
-        Inventory.objects
-        .filter(product=product, quantity__gt=0)
-        .select_related("warehouse", "bin")
-        .order_by("-quantity")
-        .first()
-    )
-    location = inv.bin.code if inv and inv.bin else ""
+    # Одним запросом: товар (по уникальному индексу barcode), ячейка с
+    # наибольшим остатком и цена закупки для расчёта наценки.
+    # Только нужные колонки — без описаний и прочих тяжёлых полей товара
+    try:
+        product = (
+            Product.objects
+            .values("id", "name", "barcode", "sku",
+                    location=_top_inventory("bin__code"), purchase_price=_contract_price())
+            .get(barcode=barcode)
+        )
+    except Product.DoesNotExist:
+        # «не найден» не кэшируем: только что заведённый товар должен
+        # находиться сразу, не дожидаясь TTL
+        return JsonResponse(STOCK_LOOKUP_NOT_FOUND, status=404)
+
+    location = product["location"] or ""
     unit = "шт"
+    purchase_price = product["purchase_price"]
 
-    # Получаем цену закупки для расчета наценки
-    from .views import _price_for
-    purchase_price = _price_for(product, ["contracts", "contract"])
-    
-    return JsonResponse({
+    data = {
         "ok": True,
-        "id": product.id,
-        "name": product.name,
-        "barcode": product.barcode or "",
-        "sku": product.sku or "",
+        "id": product["id"],
+        "name": product["name"],
+        "barcode": product["barcode"] or "",
+        "sku": product["sku"] or "",
         "location": location,
         "unit": unit,
         "purchase_price": float(purchase_price) if purchase_price else None,  # Цена закупки для расчета наценки
-    })
+    }
+    cache.set(cache_key, data, STOCK_LOOKUP_CACHE_TTL)
+    return JsonResponse(data)
 
 
 @require_GET
@@ -108,15 +161,15 @@ def stock_lookup_by_sku(request):
     
     logger.debug(f"Товар найден: id={product.id}, name={product.name}, supplier={product.supplier.code}, sku={product.sku}, vendor_code={product.vendor_code}")
 
-    # Проверяем наличие на складе (не обязательно - товар может быть без остатков)
-    inv = (
+    # Проверяем наличие на складе (не обязательно - товар может быть без остатков);
+    # нужен только код ячейки — берём скаляр, без моделей остатка/склада/ячейки
+    location = (
         Inventory.objects
         .filter(product=product, quantity__gt=0)
-        .select_related("warehouse", "bin")
         .order_by("-quantity")
+        .values_list("bin__code", flat=True)
         .first()
-    )
-    location = inv.bin.code if inv and inv.bin else ""
+    ) or ""
     unit = "шт"
 
     # Определяем, какой артикул использовать для ответа
@@ -157,7 +210,14 @@ def stock_lookup_by_name(request):
     if len(query) < 3:
         return JsonResponse({"ok": True, "products": []})
 
-    # Ищем товары по названию (case-insensitive) - используем тот же подход, что и в каталоге
+    cache_key = stock_lookup_name_cache_key(query)
+    data = cache.get(cache_key)
+    if data is not None:
+        return JsonResponse(data)
+
+    # Ищем товары по названию (case-insensitive) - используем тот же подход, что и в каталоге.
+    # Каждая ветка OR индексируема: триграммные GIN по UPPER(name/sku/brand/vendor_code)
+    # и varchar_pattern_ops по barcode — вместо полного просмотра таблицы BitmapOr
     from django.db.models import Q
     products = (
         Product.objects
@@ -169,49 +229,39 @@ def stock_lookup_by_name(request):
             Q(vendor_code__icontains=query),
             is_active=True
         )
-        .select_related("supplier")
-        .order_by("name")[:20]  # Ограничиваем до 20 результатов
+        .order_by("name")
+        # одним запросом: поля ответа (словари вместо моделей), ячейка и
+        # количество по строке с наибольшим остатком, цена закупки
+        .annotate(
+            inv_loc=_top_inventory("bin__code"),
+            inv_qty=_top_inventory("quantity"),
+            purchase_price=_contract_price(),
+        )
+        .values("id", "name", "barcode", "sku", "vendor_code", "inv_loc", "inv_qty", "purchase_price")[:20]
     )
 
-    # Возвращаем все найденные товары (как в каталоге)
-    # Проверку наличия на складе делаем при выборе товара
+    # Возвращаем все найденные товары (как в каталоге), в т.ч. без остатков —
+    # проверку наличия на складе делаем при выборе товара
     result = []
     for product in products:
-        # Проверяем наличие на складе, но не фильтруем - показываем все товары
-        inv = (
-            Inventory.objects
-            .filter(product=product, quantity__gt=0)
-            .select_related("warehouse", "bin")
-            .order_by("-quantity")
-            .first()
-        )
-        
-        location = ""
-        qty_on_hand = 0
-        if inv:
-            location = inv.bin.code if inv and inv.bin else ""
-            qty_on_hand = float(inv.quantity)
-        
-        # Определяем артикул: для relef в vendor_code, для других в sku
-        article_value = product.sku or product.vendor_code or ""
-        
-        # Получаем цену закупки для расчета наценки
-        from .views import _price_for
-        purchase_price = _price_for(product, ["contracts", "contract"])
-        
+        qty_on_hand = float(product["inv_qty"] or 0)
+        purchase_price = product["purchase_price"]
         result.append({
-            "id": product.id,
-            "name": product.name,
-            "barcode": product.barcode or "",
-            "sku": article_value,  # Возвращаем артикул (sku или vendor_code)
-            "location": location,
+            "id": product["id"],
+            "name": product["name"],
+            "barcode": product["barcode"] or "",
+            # артикул: для relef в vendor_code, для других в sku
+            "sku": product["sku"] or product["vendor_code"] or "",
+            "location": product["inv_loc"] or "",
             "unit": "шт",
             "qty_on_hand": qty_on_hand,
             "has_stock": qty_on_hand > 0,  # Флаг наличия на складе
             "purchase_price": float(purchase_price) if purchase_price else None,  # Цена закупки для расчета наценки
         })
 
-    return JsonResponse({"ok": True, "products": result})
+    data = {"ok": True, "products": result}
+    cache.set(cache_key, data, STOCK_NAME_CACHE_TTL)
+    return JsonResponse(data)
 
 
 @require_GET
@@ -226,30 +276,35 @@ def stock_lookup_by_name_selected(request):
     except (ValueError, TypeError):
         return JsonResponse({"ok": False, "error": "invalid_id"}, status=400)
 
-    try:
-        product = Product.objects.get(id=product_id, is_active=True)
-    except Product.DoesNotExist:
+    product = (
+        Product.objects
+        .filter(id=product_id, is_active=True)
+        .values_list("name", "barcode")
+        .first()
+    )
+    if not product:
         return JsonResponse({"ok": False, "error": "not_found"}, status=404)
+    name, barcode = product
 
     inv = (
         Inventory.objects
-        .filter(product=product, quantity__gt=0)
-        .select_related("warehouse", "bin")
+        .filter(product_id=product_id, quantity__gt=0)
         .order_by("-quantity")
+        .values_list("bin__code", "quantity")
         .first()
     )
 
     if not inv:
         return JsonResponse({"ok": False, "error": "out_of_stock"}, status=404)
 
-    location = inv.bin.code if inv and inv.bin else ""
+    location, quantity = inv
     return JsonResponse({
         "ok": True,
-        "name": product.name,
-        "barcode": product.barcode or "",
-        "location": location,
+        "name": name,
+        "barcode": barcode or "",
+        "location": location or "",
         "unit": "шт",
-        "qty_on_hand": float(inv.quantity),
+        "qty_on_hand": float(quantity),
     })
 
 
@@ -263,20 +318,93 @@ def request_pick_section(request, pk: int):
 # ----------------------------- #
 #     Сохранение листа сборки    #
 # ----------------------------- #
+_PICK_FIELDS = ("barcode", "name", "qty", "location", "unit", "price")
+
+
+def _scan_pick_rows(post, prefix="pick"):
+    """
+    Строки формсета из POST одним проходом по ключам: [{поле: значение}, ...]
+    в порядке индексов. Берутся только индексы < TOTAL_FORMS, значения — без пробелов по краям.
+    """
+    try:
+        total = int(post.get(f"{prefix}-TOTAL_FORMS", 0))
+    except ValueError:
+        total = 0
+    head = f"{prefix}-"
+    rows = {}
+    for key, value in post.items():
+        if not key.startswith(head):
+            continue
+        idx, sep, field = key[len(head):].partition("-")
+        if not sep or not idx.isdigit() or int(idx) >= total:
+            continue
+        rows.setdefault(int(idx), {})[field] = value.strip()
+    return [rows[i] for i in sorted(rows)]
+
+
+_PICK_ITEM_FIELDS = ("name", "location", "unit", "qty", "price")
+
+
+def _sync_pick_items(req, items):
+    """
+    Приводит лист сборки к items без полной перезаписи: строки, совпавшие по
+    штрихкоду, обновляются только при изменениях (прогресс склада сохраняется),
+    новые добавляются, лишние удаляются.
+    """
+    existing = {}
+    for pi in PickItem.objects.filter(request=req):
+        existing.setdefault(pi.barcode, []).append(pi)
+
+    now = timezone.now()
+    to_create, to_update = [], []
+    for it in items:
+        it = {**it, "price": Decimal(str(it["price"] or 0))}
+        same = existing.get(it["barcode"])
+        if not same:
+            to_create.append(PickItem(request=req, **it))
+            continue
+        pi = same.pop(0)
+        if any(getattr(pi, f) != it[f] for f in _PICK_ITEM_FIELDS):
+            for f in _PICK_ITEM_FIELDS:
+                setattr(pi, f, it[f])
+            pi.updated_at = now
+            to_update.append(pi)
+    to_delete = [pi.pk for rest in existing.values() for pi in rest]
+
+    if to_delete:
+        PickItem.objects.filter(pk__in=to_delete).delete()
+    if to_create:
+        PickItem.objects.bulk_create(to_create, batch_size=500)
+    if to_update:
+        PickItem.objects.bulk_update(to_update, [*_PICK_ITEM_FIELDS, "updated_at"], batch_size=500)
+
+
 @require_POST
 @require_groups("operator", "director")
+@transaction.atomic
 def pick_submit(request, pk: int):
     """
     Принимает форму сборки.
     commit=save -> сохранить (в т.ч. можно очистить лист сборки)
     commit=send -> сохранить и перевести в TO_PICK (только если есть позиции)
+    Все записи (позиции, статус, история) — одной транзакцией, один COMMIT.
     """
-    req = get_object_or_404(Request, pk=pk)
+    req = get_object_or_404(
+        Request.objects.only("id", "status", "updated_at", "initiator", "assignee"), pk=pk,
+    )
     commit = (request.POST.get("commit") or "save").lower()
 
     items = []
 
-    if PickItemFormSet is not None:
+    # Ни в одной строке нет данных — позиций не будет при любом исходе,
+    # полную валидацию формсета не запускаем (без management-формы —
+    # валидируем как раньше, чтобы получить ошибку, а не очистку листа)
+    rows = _scan_pick_rows(request.POST)
+    has_rows = "pick-TOTAL_FORMS" not in request.POST or any(
+        any(row.get(f) for f in _PICK_FIELDS) for row in rows
+    )
+
+    if has_rows and PickItemFormSet is not None:
         formset = PickItemFormSet(request.POST, prefix="pick")
         if not formset.is_valid():
             messages.error(request, "Проверьте строки сборки — есть ошибки.")
@@ -285,31 +413,31 @@ def pick_submit(request, pk: int):
         for cd in formset.cleaned_data:
             if not cd or cd.get("DELETE"):
                 continue
-            if any(cd.get(k) for k in ("barcode", "name", "qty", "location", "unit", "price")):
+            bc   = cd.get("barcode") or ""
+            nm   = cd.get("name") or ""
+            loc  = cd.get("location") or ""
+            unit = cd.get("unit") or ""
+            q    = cd.get("qty")
+            price = cd.get("price") or 0
+            if bc or nm or q or loc or unit or price:
                 items.append({
-                    "barcode":  cd.get("barcode") or "",
-                    "name":     cd.get("name") or "",
-                    "location": cd.get("location") or "",
-                    "unit":     cd.get("unit") or "",
-                    "qty":      int(cd.get("qty") or 0) or 1,
-                    "price":    cd.get("price") or 0,
+                    "barcode":  bc,
+                    "name":     nm,
+                    "location": loc,
+                    "unit":     unit,
+                    "qty":      int(q or 0) or 1,
+                    "price":    price,
                 })
-    else:
-        try:
-            total = int(request.POST.get("pick-TOTAL_FORMS", 0))
-        except ValueError:
-            total = 0
-        for i in range(total):
-            bc   = (request.POST.get(f"pick-{i}-barcode") or "").strip()
-            nm   = (request.POST.get(f"pick-{i}-name") or "").strip()
-            q    = (request.POST.get(f"pick-{i}-qty") or "").strip()
-            loc  = (request.POST.get(f"pick-{i}-location") or "").strip()
-            unit = (request.POST.get(f"pick-{i}-unit") or "").strip()
-            price = (request.POST.get(f"pick-{i}-price") or "").strip()
+    elif has_rows:
+        # POST уже разобран одним проходом выше — используем те же строки
+        for row in rows:
+            bc, nm, q, loc, unit, price = (row.get(f, "") for f in _PICK_FIELDS)
             if bc or nm or q or loc or unit or price:
                 qty = int(q or 0) or 1
+                if "," in price:
+                    price = price.replace(",", ".")
                 try:
-                    pr = float((price or "0").replace(",", "."))
+                    pr = float(price or "0")
                 except Exception:
                     pr = 0
                 items.append({
@@ -324,17 +452,16 @@ def pick_submit(request, pk: int):
 
         # commit=save: трактуем как очистку листа сборки
         deleted = PickItem.objects.filter(request=req).delete()[0]
-        RequestHistory.objects.create(
-            request=req, author=request.user,
+        write_history(RequestHistory(
+            request_id=req.pk, author_id=request.user.pk,
             from_status=req.status, to_status=req.status,
             note=f"Очищен лист сборки (удалено позиций: {deleted}).",
-        )
+        ))
         messages.success(request, "Лист сборки очищен.")
         return redirect("core:request_detail", pk=pk)
 
-    # ---- сохраняем новые позиции (перезапись) ----
-    PickItem.objects.filter(request=req).delete()
-    PickItem.objects.bulk_create([PickItem(request=req, **it) for it in items])
+    # ---- сохраняем позиции (по разнице с текущим листом) ----
+    _sync_pick_items(req, items)
 
     # ---- поведение по commit ----
     if commit == "send":
@@ -343,40 +470,43 @@ def pick_submit(request, pk: int):
             return redirect("core:request_detail", pk=pk)
 
         old = req.status
-        if req.status == RequestStatus.APPROVED:
+        # Один UPDATE с условием по статусу (compare-and-set, без сигналов save):
+        # если параллельно заявку уже перевели, строка не обновится
+        moved = old == RequestStatus.APPROVED and Request.objects.filter(
+            pk=req.pk, status=RequestStatus.APPROVED,
+        ).update(status=RequestStatus.TO_PICK, updated_at=timezone.now())
+        if moved:
             req.status = RequestStatus.TO_PICK
-            req.save(update_fields=["status", "updated_at"])
-            RequestHistory.objects.create(
-                request=req, author=request.user,
-                from_status=old, to_status=req.status,
-                note=f"Создан лист сборки, позиций: {len(items)}",
-            )
+            # post_save не было — карточки инициатора/исполнителя сбрасываем сами
+            reset_employee_detail_cache(req.initiator_id, req.assignee_id)
+            note = f"Создан лист сборки, позиций: {len(items)}"
         else:
-            RequestHistory.objects.create(
-                request=req, author=request.user,
-                from_status=old, to_status=old,
-                note=f"Обновлён лист сборки, позиций: {len(items)}",
-            )
+            note = f"Обновлён лист сборки, позиций: {len(items)}"
         messages.success(request, "Отправлено на склад. Заявка появилась в списке склада.")
     else:
-        RequestHistory.objects.create(
-            request=req, author=request.user,
-            from_status=req.status, to_status=req.status,
-            note=f"Сохранён черновик листа сборки, позиций: {len(items)}",
-        )
+        old = req.status
+        note = f"Сохранён черновик листа сборки, позиций: {len(items)}"
         messages.success(request, "Черновик листа сборки сохранён.")
 
+    # История — одна запись через write_history (сброс кэша карточки автора),
+    # в той же транзакции, что и позиции
+    write_history(RequestHistory(
+        request_id=req.pk, author_id=request.user.pk,
+        from_status=old, to_status=req.status, note=note,
+    ))
+
     return redirect("core:request_detail", pk=pk)
 
 @require_POST
 @require_groups("warehouse", "director")
+@transaction.atomic
 def pick_confirm(request, pk: int):
-    """Сохраняем прогресс скан-сборки (черновик)."""
-    req = get_object_or_404(Request, pk=pk)
+    """Сохраняем прогресс скан-сборки (черновик). Строки и история — одной транзакцией."""
+    req = get_object_or_404(Request.objects.only("id", "status", "updated_at"), pk=pk)
 
     try:
-        payload = json.loads(request.body.decode("utf-8"))
-    except Exception:
+        payload = orjson.loads(request.body)  # bytes напрямую, без decode
+    except orjson.JSONDecodeError:
         return JsonResponse({"ok": False, "error": "bad_json"}, status=400)
 
     lines = payload.get("lines") or []
@@ -387,22 +517,33 @@ def pick_confirm(request, pk: int):
     want = { (l.get("barcode") or "").strip(): l for l in lines if l.get("barcode") }
 
     items = list(PickItem.objects.filter(request=req, barcode__in=want.keys()))
+    changed = []
     for it in items:
         l = want.get(it.barcode) or {}
-        it.picked_qty = max(0, int(l.get("picked_qty") or 0))
-        it.missing    = bool(l.get("missing"))
-        it.note       = (l.get("note") or "")[:255]
-
-    if items:
-        PickItem.objects.bulk_update(items, ["picked_qty", "missing", "note", "updated_at"])
-
-    RequestHistory.objects.create(
-        request=req, author=request.user,
+        picked_qty = max(0, int(l.get("picked_qty") or 0))
+        missing    = bool(l.get("missing"))
+        note       = (l.get("note") or "")[:255]
+        # сканер часто присылает строку без изменений — такие не пишем
+        if (picked_qty, missing, note) == (it.picked_qty, it.missing, it.note):
+            continue
+        it.picked_qty, it.missing, it.note = picked_qty, missing, note
+        it.updated_at = Now()  # время ставит БД в том же UPDATE
+        changed.append(it)
+
+    if changed:
+        PickItem.objects.bulk_update(changed, ["picked_qty", "missing", "note", "updated_at"], batch_size=500)
+
+    write_history(RequestHistory(
+        request_id=req.pk, author_id=request.user.pk,
         from_status=req.status, to_status=req.status,
         note=f"Сохранён черновик скан-сборки: {len(items)} строк."
-    )
+    ))
+
+    return HttpResponse(orjson.dumps({"ok": True}), content_type="application/json")
+
+_PICK_ROWS_SLOT = "<!--pick-rows-->"
+_PICK_PRINT_CHUNK = 500
 
-    return JsonResponse({"ok": True})
 
 @require_GET
 @require_groups("operator", "director", "warehouse")
@@ -410,9 +551,24 @@ def pick_print(request, pk: int):
     req = get_object_or_404(Request, pk=pk)
     items = (PickItem.objects
              .filter(request=req)
-             .order_by("name", "barcode"))
-    return render(request, "core/pick_print.html", {
-        "obj": req,
-        "items": items,
-    })
+             .order_by("name", "barcode")
+             .values("barcode", "name", "location", "unit", "qty"))
+
+    # Как и список клиентов: страницу рендерим без строк, строки отдаём
+    # потоком порциями по курсору — большой лист не держим в памяти целиком
+    page = render_to_string("core/pick_print.html", {"obj": req}, request=request)
+    head, sep, tail = page.partition(_PICK_ROWS_SLOT)
+    if not sep:
+        return HttpResponse(page)
+
+    rows_template = get_template("core/partials/pick_print_rows.html")
+
+    def stream():
+        yield head
+        rows = items.iterator(chunk_size=_PICK_PRINT_CHUNK)
+        while chunk := list(islice(rows, _PICK_PRINT_CHUNK)):
+            yield rows_template.render({"items": chunk})
+        yield tail
+
+    return StreamingHttpResponse(stream())
 
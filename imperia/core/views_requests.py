@@ -1,28 +1,32 @@
 # core/views_requests.py
 from decimal import Decimal, InvalidOperation
-import re
 from datetime import date
+from functools import lru_cache
 from mimetypes import guess_type
+from urllib.parse import quote as url_quote
 from django.urls import reverse
 from django.contrib import messages
 from django.db.models import Q, ForeignKey, OneToOneField, ManyToManyField
 from django.http import HttpResponseBadRequest, FileResponse, Http404, JsonResponse, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.http import require_GET
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_POST
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
-from django.apps import apps
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.core.exceptions import FieldDoesNotExist
 from django.conf import settings
+from django.utils import timezone
 from .services.upd_xml import Upd970, parse_address
 from .services.upd_excel_fixed import fill_upd
 import uuid
 import os
 import tempfile
-from django.http import HttpResponse
 
 from .permissions import require_groups
+from .utils.pagination import keyset_paginate
+from .utils.roles import group_names
+from .utils.caches import reset_employee_detail_cache
+from .utils.history import write_history
 from .forms_requests import (
     RequestForm,
     RequestCreateForm,
@@ -43,7 +47,6 @@ from .models_requests import (
     RequestQuote,
     RequestQuoteItem,
     RequestShipment,
-    RequestShipmentItem,
 )
 from django.db.models import Prefetch
 from .models_pick import PickItem
@@ -56,11 +59,39 @@ try:
 except Exception:
     PickItemFormSet = None
 
-# ✅ безопасный импорт моделей листа сборки (для просмотра складом)
-try:
-    from .models_pick import PickList
-except Exception:
-    PickList = None
+
+def _field_is(model, name, kinds):
+    try:
+        return isinstance(model._meta.get_field(name), kinds)
+    except FieldDoesNotExist:
+        return False
+
+
+# Схема Counterparty во время работы процесса не меняется — способ привязки
+# менеджера определяем один раз при импорте, а не в каждом запросе
+_CP_HAS_MANAGER_FK = _field_is(Counterparty, "manager", (ForeignKey, OneToOneField))
+_CP_HAS_MANAGERS_M2M = _field_is(Counterparty, "managers", ManyToManyField)
+
+
+def _get_request_minimal(pk, *extra):
+    """
+    Заявка для write-путей: только id/status/updated_at (+ extra), без широкой
+    строки. initiator/assignee читает post_save-сигнал — берём сразу, иначе
+    догрузка отдельными запросами.
+    """
+    return get_object_or_404(
+        Request.objects.only("id", "status", "updated_at", "initiator", "assignee", *extra), pk=pk
+    )
+
+
+def _get_item_with_request(pk, item_id):
+    """Позиция заявки вместе со статусом самой заявки — одним запросом (JOIN)."""
+    return get_object_or_404(
+        RequestItem.objects
+        .select_related("request")
+        .only("id", "request", "product", "title", "quantity", "note", "request__status"),
+        pk=item_id, request_id=pk,
+    )
 
 
 def _can_manager_access_request(user, request_obj):
@@ -70,85 +101,75 @@ def _can_manager_access_request(user, request_obj):
     1. Он является инициатором заявки
     2. Он прикреплен к контрагенту заявки (через managers ManyToMany)
     """
-    if not user.groups.filter(name="manager").exists():
+    if "manager" not in group_names(user):
         return False
     
-    # Если менеджер создал заявку - доступ есть
-    if request_obj.initiator == user:
+    # Если менеджер создал заявку - доступ есть (сравниваем id, без загрузки связей)
+    if request_obj.initiator_id == user.pk:
         return True
     
     # Если есть контрагент, проверяем привязку
-    if request_obj.counterparty:
-        # Проверяем ManyToMany поле managers
-        if request_obj.counterparty.managers.filter(pk=user.pk).exists():
+    if request_obj.counterparty_id:
+        # Проверяем ManyToMany поле managers — по промежуточной таблице
+        if _CP_HAS_MANAGERS_M2M and Counterparty.managers.through.objects.filter(
+            counterparty_id=request_obj.counterparty_id, user_id=user.pk
+        ).exists():
             return True
         
         # Проверяем ForeignKey поле manager (если есть)
-        Counterparty = apps.get_model("core", "Counterparty")
-        try:
-            fld = Counterparty._meta.get_field("manager")
-            if isinstance(fld, (ForeignKey, OneToOneField)):
-                manager_field = getattr(request_obj.counterparty, "manager", None)
-                if manager_field == user:
-                    return True
-        except FieldDoesNotExist:
-            pass
+        if _CP_HAS_MANAGER_FK and request_obj.counterparty.manager_id == user.pk:
+            return True
     
     return False
 
 
 # ---------- Список заявок ----------
+REQUEST_LIST_PER_PAGE = 50
+
+
 @require_groups("manager", "operator", "warehouse", "director")
 def request_list(request):
     status = request.GET.get("status")
     u = request.user
+    has_cp_manager_fk = _CP_HAS_MANAGER_FK
+    has_cp_managers_m2m = _CP_HAS_MANAGERS_M2M
 
-    Counterparty = apps.get_model("core", "Counterparty")
-
-    has_cp_manager_fk = False
-    has_cp_managers_m2m = False
-    try:
-        fld = Counterparty._meta.get_field("manager")
-        has_cp_manager_fk = isinstance(fld, (ForeignKey, OneToOneField))
-    except FieldDoesNotExist:
-        pass
-    try:
-        fld = Counterparty._meta.get_field("managers")
-        has_cp_managers_m2m = isinstance(fld, ManyToManyField)
-    except FieldDoesNotExist:
-        pass
-
-    qs = Request.objects.select_related("initiator", "assignee", "counterparty")
-    if has_cp_manager_fk:
-        qs = qs.select_related("counterparty__manager")
+    # Только колонки, которые выводит список (requests/list.html).
+    # Контрагентов на странице немного, а заявок у каждого много — берём их
+    # отдельным IN-запросом, а не LEFT JOIN на каждую строку
+    qs = (
+        Request.objects
+        .select_related("initiator")
+        .prefetch_related(Prefetch("counterparty", queryset=Counterparty.objects.only("id", "name")))
+        .only(
+            "id", "number", "title", "status", "is_paid", "created_at",
+            "counterparty", "initiator__username",
+        )
+    )
 
-    # --- Ролевые фильтры ---
-    is_warehouse = u.groups.filter(name="warehouse").exists()
-    is_manager = u.groups.filter(name="manager").exists()
-    is_operator = u.groups.filter(name="operator").exists()
-    is_director = u.groups.filter(name="director").exists()
+    # --- Ролевые фильтры (группы — одним запросом, общим с require_groups) ---
+    user_groups = group_names(u)
+    is_warehouse = "warehouse" in user_groups
+    is_manager = "manager" in user_groups
+    is_operator = "operator" in user_groups
+    is_director = "director" in user_groups
     has_full_access = u.is_superuser or is_director
     has_operator_access = u.is_superuser or is_director or is_operator
     
     if is_warehouse and not has_operator_access:
         # Склад видит только заявки на сбор, готовые к отгрузке и в доставке
-        qs = qs.filter(
-            status__in=[
-                RequestStatus.TO_PICK,
-                RequestStatus.IN_PROGRESS,
-                RequestStatus.READY_TO_SHIP,
-                RequestStatus.IN_DELIVERY,
-            ]
-        )
+        qs = qs.filter(status__in=_WAREHOUSE_ENTRY_STATUSES)
     elif is_manager and not has_operator_access:
         # Менеджер видит:
         # 1. Заявки контрагентов, к которым он прикреплен
         # 2. Заявки, которые он сам создал
         cond = Q(initiator=u)
         
-        # Проверяем привязку через ManyToMany поле managers
+        # Проверяем привязку через ManyToMany поле managers — подзапросом по
+        # промежуточной таблице, без JOIN контрагента и M2M в основной выборке
         if has_cp_managers_m2m:
-            cond |= Q(counterparty__managers=u)
+            cond |= Q(counterparty_id__in=Counterparty.managers.through.objects
+                      .filter(user_id=u.pk).values("counterparty_id"))
         # Проверяем привязку через ForeignKey поле manager (если есть)
         if has_cp_manager_fk:
             cond |= Q(counterparty__manager=u)
@@ -156,9 +177,10 @@ def request_list(request):
         qs = qs.filter(cond)
     # Оператор и директор видят все заявки (кроме чужих черновиков - см. ниже)
 
-    # Фильтрация по статусу
+    # Фильтрация по статусу; неизвестный статус (мусор в ?status=) заведомо
+    # пуст — отдаём пустую выборку без запроса к БД
     if status:
-        qs = qs.filter(status=status)
+        qs = qs.filter(status=status) if status in _ALL_STATUSES else qs.none()
     
     # Специальная обработка для черновиков:
     # - Директор видит все черновики
@@ -172,11 +194,16 @@ def request_list(request):
             # Если не фильтруем по статусу, исключаем чужие черновики
             qs = qs.exclude(Q(status=RequestStatus.DRAFT) & ~Q(initiator=u))
 
+    # Keyset-пагинация по (created_at, id) вместо среза [:500]: без OFFSET
+    # и без скрытого обрезания длинного списка
+    page_obj = keyset_paginate(qs, request.GET.get("after"), REQUEST_LIST_PER_PAGE)
+
     return render(
         request,
         "requests/list.html",
         {
-            "requests": qs.order_by("-created_at")[:500],
+            "requests": page_obj.object_list,
+            "page_obj": page_obj,
             "status": status,
             "statuses": RequestStatus,
             "is_warehouse_only": is_warehouse and not has_operator_access,
@@ -196,16 +223,18 @@ def _parse_qty(v: str) -> Decimal:
 
 
 def _in_groups(user, names):
-    return user.is_authenticated and user.groups.filter(name__in=names).exists()
+    return not group_names(user).isdisjoint(names)
 
 
 @transaction.atomic
-def _create_pick_items_from_quote(request_obj, actor):
+def _create_pick_items_from_quote(request_obj, actor, active_quote=None):
     """
     Автоматически создает PickItem из товаров активного КП.
     Вызывается при переходе заявки в статус TO_PICK.
+    active_quote можно передать, если вызывающий уже его загрузил.
     """
-    active_quote = request_obj.active_quote
+    if active_quote is None:
+        active_quote = request_obj.active_quote
     if not active_quote:
         return []
     
@@ -271,34 +300,34 @@ def request_create(request):
                 if "submit" in request.POST
                 else RequestStatus.DRAFT
             )
-            obj.save()
-
-            # Сохраняем позиции заказа из формсета
+            # Позиции заказа из формсета
+            rows = []
             for item_form in order_formset:
                 if item_form.cleaned_data and not item_form.cleaned_data.get("DELETE"):
                     product_id = item_form.cleaned_data.get("product_id")
                     name = item_form.cleaned_data.get("name", "").strip()
                     quantity = item_form.cleaned_data.get("quantity") or Decimal("1")
                     note = item_form.cleaned_data.get("note", "").strip()
-                    
                     if name or product_id:
-                        product = None
-                        if product_id:
-                            try:
-                                from .models import Product
-                                product = Product.objects.get(id=product_id)
-                                if not name:
-                                    name = product.name
-                            except Exception:
-                                pass
-                        
-                        RequestItem.objects.create(
-                            request=obj,
-                            product=product,
-                            title=name,
-                            quantity=quantity,
-                            note=note
-                        )
+                        rows.append((product_id, name, quantity, note))
+
+            # Товары — одним запросом, позиции — одним INSERT вместе с заявкой
+            products = Product.objects.only("id", "name").in_bulk(
+                {r[0] for r in rows if r[0]}
+            )
+            with transaction.atomic():
+                obj.save()
+                items = []
+                for product_id, name, quantity, note in rows:
+                    product = products.get(product_id)
+                    items.append(RequestItem(
+                        request=obj,
+                        product=product,
+                        title=name or (product.name if product else ""),
+                        quantity=quantity,
+                        note=note,
+                    ))
+                RequestItem.objects.bulk_create(items, batch_size=500)
 
             messages.success(request, "Заявка создана")
             return redirect("core:request_detail", pk=obj.pk)
@@ -313,24 +342,49 @@ def request_create(request):
 
 
 # ---------- Детали заявки ----------
+# Лента истории в карточке — последние записи; вся история по ?history=all
+REQUEST_HISTORY_LIMIT = 50
+
+
 @require_groups("manager", "operator", "warehouse", "director")
 def request_detail(request, pk: int):
+    show_all_history = request.GET.get("history") == "all"
+    history_qs = (
+        RequestHistory.objects
+        .select_related("author")
+        .only("id", "request_id", "from_status", "to_status", "created_at", "note", "author__username")
+        .order_by("-created_at", "-id")
+    )
+    if not show_all_history:
+        # на одну больше — так узнаём, что история обрезана
+        history_qs = history_qs[:REQUEST_HISTORY_LIMIT + 1]
+
     # Заявка + связанные данные, pick_items сразу в нужном порядке
     obj = get_object_or_404(
         Request.objects
         .select_related("initiator", "assignee", "counterparty")
         .prefetch_related(
-            "items", "history", "comments", "quotes",
+            # comments на странице не выводятся — не грузим; историю —
+            # последние записи с авторами (у заявки их бывают тысячи),
+            # КП — вместе с загрузившим (выводится в списке файлов);
+            # у позиций из товара нужно только название (если нет своего)
+            Prefetch(
+                "items",
+                queryset=RequestItem.objects
+                .select_related("product")
+                .only("id", "request_id", "title", "quantity", "note", "product__name"),
+            ),
+            Prefetch("quotes", queryset=RequestQuote.objects.select_related("uploaded_by")),
+            Prefetch("history", queryset=history_qs, to_attr="recent_history"),
             Prefetch("pick_items", queryset=PickItem.objects.order_by("id")),
-            Prefetch("quotes__items", queryset=RequestQuoteItem.objects.select_related("product", "request_item").all()),
         ),
         pk=pk,
     )
     
     # Проверка доступа для менеджера
     u = request.user
-    is_manager = u.groups.filter(name="manager").exists()
-    has_full_access = u.is_superuser or u.groups.filter(name__in=["director", "operator"]).exists()
+    is_manager = "manager" in group_names(u)
+    has_full_access = u.is_superuser or not group_names(u).isdisjoint(("director", "operator"))
     
     if is_manager and not has_full_access:
         # Менеджер может видеть только свои заявки или заявки контрагентов, к которым прикреплен
@@ -339,30 +393,13 @@ def request_detail(request, pk: int):
             return HttpResponseForbidden("У вас нет доступа к этой заявке")
     
     # Проверка доступа для склада
-    is_warehouse = u.groups.filter(name="warehouse").exists()
+    is_warehouse = "warehouse" in group_names(u)
     if is_warehouse and not has_full_access:
         # Склад может видеть только заявки на сбор
         if obj.status not in [RequestStatus.TO_PICK, RequestStatus.IN_PROGRESS, RequestStatus.READY_TO_SHIP]:
             from django.http import HttpResponseForbidden
             return HttpResponseForbidden("У вас нет доступа к этой заявке")
 
-    # Форма добавления позиции
-    item_form = RequestItemForm()
-
-    # Inline-редактирование позиции
-    edit_item = None
-    edit_form = None
-    edit_id = request.GET.get("edit")
-    if edit_id:
-        try:
-            edit_item = obj.items.get(pk=int(edit_id))
-            edit_form = RequestItemEditForm(instance=edit_item)
-        except (ValueError, RequestItem.DoesNotExist):
-            pass
-
-    # Форма КП
-    quote_form = RequestQuoteForm()
-
     # --- СЕКЦИЯ СБОРКИ (оператор/директор, только в статусе approved) ---
     try:
         from .forms_pick import PickItemFormSet
@@ -391,15 +428,18 @@ def request_detail(request, pk: int):
 
     # Список строк сборки для превью/склада.
     # ДОБАВЛЕНО: picked_qty, missing, note — чтобы модалка подставляла сохранённые значения.
-    pick_items = list(
-        obj.pick_items.values(
-            "barcode", "name", "location", "unit", "qty", "price",
-            "picked_qty", "missing", "note"
-        )
-    )
+    # Берём из prefetch pick_items — без повторного запроса
+    pick_items = [
+        {
+            "barcode": it.barcode, "name": it.name, "location": it.location,
+            "unit": it.unit, "qty": it.qty, "price": it.price,
+            "picked_qty": it.picked_qty, "missing": it.missing, "note": it.note,
+        }
+        for it in obj.pick_items.all()
+    ]
 
     # Истина, если строки сборки есть (шаблону важен сам факт)
-    latest_pick = obj.pick_items.first()
+    latest_pick = next(iter(obj.pick_items.all()), None)
 
     # URL приёма сохранения скан-сборки (без двоеточий в имени)
     pick_confirm_url = reverse("core:pick_confirm", args=[obj.pk])
@@ -410,7 +450,8 @@ def request_detail(request, pk: int):
     quote_total = Decimal("0")
     if active_quote:
         try:
-            quote_items = list(active_quote.items.select_related("product", "request_item").all())
+            # таблица КП выводит только наименование, кол-во, цену и сумму
+            quote_items = list(active_quote.items.only("id", "quote_id", "title", "quantity", "price", "total"))
             # Безопасно суммируем total, обрабатывая возможные None значения
             quote_total = sum(
                 (item.total if item.total is not None else Decimal("0")) 
@@ -438,6 +479,11 @@ def request_detail(request, pk: int):
     # Проверка возможности добавления товаров
     is_manager_only = is_manager and not has_full_access
     can_add_items = (is_manager_only and obj.is_editable) or (has_full_access and obj.can_add_items)
+    # Форма добавления позиции выводится только при can_add_items.
+    # Формы редактирования позиции и загрузки КП шаблон не рендерит
+    # (inline-редактирование — своя разметка в строках таблицы, КП создаются
+    # на отдельной странице)
+    item_form = RequestItemForm() if can_add_items else None
     
     # Проверка возможности редактирования позиций
     can_edit_items = (is_manager_only and obj.is_editable) or (has_full_access and obj.can_add_items)
@@ -467,15 +513,28 @@ def request_detail(request, pk: int):
             'has_shipments': has_shipments,
         })
     
-    # Получаем даты прохождения этапов из истории
+    # Лента истории в хронологическом порядке
+    history = obj.recent_history[:REQUEST_HISTORY_LIMIT] if not show_all_history else obj.recent_history
+    history_truncated = len(obj.recent_history) > len(history)
+    history.reverse()
+
+    # Даты прохождения этапов — первая запись о каждом статусе по всей
+    # истории (DISTINCT ON, строк не больше числа статусов), а не по ленте
     status_dates = {}
-    for h in obj.history.all().order_by('created_at'):
-        if h.to_status:
-            if h.to_status not in status_dates:
-                status_dates[h.to_status] = {
-                    'date': h.created_at,
-                    'author': h.author,
-                }
+    first_by_status = (
+        RequestHistory.objects
+        .filter(request_id=obj.pk)
+        .exclude(to_status="")
+        .select_related("author")
+        .only("id", "to_status", "created_at", "author__username")
+        .order_by("to_status", "created_at", "id")
+        .distinct("to_status")
+    )
+    for h in first_by_status:
+        status_dates[h.to_status] = {
+            'date': h.created_at,
+            'author': h.author,
+        }
     
     # Добавляем дату создания для статуса draft
     if obj.created_at:
@@ -570,9 +629,6 @@ def request_detail(request, pk: int):
         {
             "obj": obj,
             "item_form": item_form,
-            "edit_item": edit_item,
-            "edit_form": edit_form,
-            "quote_form": quote_form,
             "statuses": RequestStatus,
 
             "show_pick_section": show_pick_section,
@@ -592,6 +648,8 @@ def request_detail(request, pk: int):
             "can_edit_items": can_edit_items,
             "items_with_relations": items_with_relations,
             "status_dates": status_dates,
+            "history": history,
+            "history_truncated": history_truncated,
             "display_steps": display_steps,
             "companies": companies,
             "can_edit_company": has_full_access,  # Могут редактировать только операторы и директоры
@@ -603,12 +661,12 @@ def request_detail(request, pk: int):
 @require_POST
 @require_groups("manager", "operator", "director")
 def request_add_item(request, pk: int):
-    obj = get_object_or_404(Request, pk=pk)
+    obj = _get_request_minimal(pk)
     u = request.user
     
     # Менеджер может добавлять только в редактируемых статусах
-    is_manager = u.groups.filter(name="manager").exists()
-    has_full_access = u.is_superuser or u.groups.filter(name__in=["operator", "director"]).exists()
+    is_manager = "manager" in group_names(u)
+    has_full_access = u.is_superuser or not group_names(u).isdisjoint(("operator", "director"))
     
     if is_manager and not has_full_access:
         if not obj.is_editable:
@@ -653,12 +711,13 @@ def request_add_item(request, pk: int):
 @require_POST
 @require_groups("manager", "operator", "director")
 def request_update_item(request, pk: int, item_id: int):
-    obj = get_object_or_404(Request, pk=pk)
+    it = _get_item_with_request(pk, item_id)
+    obj = it.request
     u = request.user
     
     # Проверка прав доступа
-    is_manager = u.groups.filter(name="manager").exists()
-    has_full_access = u.is_superuser or u.groups.filter(name__in=["operator", "director"]).exists()
+    is_manager = "manager" in group_names(u)
+    has_full_access = u.is_superuser or not group_names(u).isdisjoint(("operator", "director"))
     
     # Менеджер может редактировать только в редактируемых статусах
     if is_manager and not has_full_access:
@@ -669,7 +728,6 @@ def request_update_item(request, pk: int, item_id: int):
         if not obj.can_add_items:
             return HttpResponseBadRequest("Нельзя изменять позиции в завершенной или отмененной заявке")
 
-    it = get_object_or_404(RequestItem, pk=item_id, request=obj)
     form = RequestItemEditForm(request.POST, instance=it)
     if form.is_valid():
         form.save()
@@ -684,12 +742,13 @@ def request_update_item(request, pk: int, item_id: int):
 @require_POST
 @require_groups("manager", "operator", "director")
 def request_delete_item(request, pk: int, item_id: int):
-    obj = get_object_or_404(Request, pk=pk)
+    it = _get_item_with_request(pk, item_id)
+    obj = it.request
     u = request.user
     
     # Проверка прав доступа
-    is_manager = u.groups.filter(name="manager").exists()
-    has_full_access = u.is_superuser or u.groups.filter(name__in=["operator", "director"]).exists()
+    is_manager = "manager" in group_names(u)
+    has_full_access = u.is_superuser or not group_names(u).isdisjoint(("operator", "director"))
     
     # Менеджер может удалять только в редактируемых статусах
     if is_manager and not has_full_access:
@@ -700,58 +759,73 @@ def request_delete_item(request, pk: int, item_id: int):
         if not obj.can_add_items:
             return HttpResponseBadRequest("Нельзя удалять позиции в завершенной или отмененной заявке")
 
-    it = get_object_or_404(RequestItem, pk=item_id, request=obj)
     it.delete()
     messages.success(request, "Позиция удалена")
     return redirect("core:request_detail", pk=pk)
 
 
 # ---------- Смена статуса ----------
+_ALL_STATUSES = frozenset(s for s, _ in RequestStatus.choices)
+
+# Куда каждая роль может перевести заявку. Менеджеры больше не могут
+# изменять статусы через UI (блок действий скрыт для них в шаблоне)
+_STATUS_ALLOWED_BY_ROLE = {
+    "operator": _ALL_STATUSES,  # Полный доступ (как у директора)
+    "warehouse": frozenset({
+        RequestStatus.IN_PROGRESS,    # Может начать сборку
+        RequestStatus.READY_TO_SHIP,  # Может завершить сборку
+        RequestStatus.IN_DELIVERY,    # Может установить статус "В доставке"
+    }),
+    "director": _ALL_STATUSES,  # Полный доступ
+}
+
+# Склад двигает заявку в эти статусы только после передачи в сборку
+_WAREHOUSE_TARGET_STATUSES = frozenset({
+    RequestStatus.IN_PROGRESS, RequestStatus.READY_TO_SHIP, RequestStatus.IN_DELIVERY, RequestStatus.DELIVERED,
+})
+_WAREHOUSE_ENTRY_STATUSES = frozenset({
+    RequestStatus.TO_PICK, RequestStatus.IN_PROGRESS, RequestStatus.READY_TO_SHIP, RequestStatus.IN_DELIVERY,
+})
+
+
 @require_POST
 @require_groups("manager", "operator", "warehouse", "director")
+@transaction.atomic
 def request_change_status(request, pk: int):
-    obj = get_object_or_404(Request, pk=pk)
+    obj = _get_request_minimal(pk, "is_paid")
     to = request.POST.get("to")
     u = request.user
 
-    if to not in dict(RequestStatus.choices):
+    if to not in _ALL_STATUSES:
         return HttpResponseBadRequest("Неизвестный статус")
 
-    allowed = {
-        # Менеджеры больше не могут изменять статусы через UI
-        # (блок действий скрыт для них в шаблоне)
-        "operator": set(s for s, _ in RequestStatus.choices),  # Полный доступ (как у директора)
-        "warehouse": {
-            RequestStatus.IN_PROGRESS,    # Может начать сборку
-            RequestStatus.READY_TO_SHIP,  # Может завершить сборку
-            RequestStatus.IN_DELIVERY,    # Может установить статус "В доставке"
-        },
-        "director": set(s for s, _ in RequestStatus.choices),  # Полный доступ
-    }
-
-    user_groups = {g.name for g in u.groups.all()}
-    can = u.is_superuser or any(to in allowed.get(g, set()) for g in user_groups)
+    user_groups = group_names(u)
+    is_privileged = u.is_superuser or "director" in user_groups
+    can = u.is_superuser or any(to in _STATUS_ALLOWED_BY_ROLE.get(g, ()) for g in user_groups)
     if not can:
         return HttpResponseBadRequest("Недостаточно прав для смены статуса")
     
     # Менеджеры больше не могут изменять статусы
     is_manager = "manager" in user_groups
-    has_full_access = u.is_superuser or "director" in user_groups or "operator" in user_groups
+    has_full_access = is_privileged or "operator" in user_groups
     if is_manager and not has_full_access:
         return HttpResponseBadRequest("Менеджеры не могут изменять статусы заявок")
 
     # ✅ склад двигает только после передачи в сборку
     if (
         "warehouse" in user_groups
-        and to in {RequestStatus.IN_PROGRESS, RequestStatus.READY_TO_SHIP, RequestStatus.IN_DELIVERY, RequestStatus.DELIVERED}
-        and obj.status not in {RequestStatus.TO_PICK, RequestStatus.IN_PROGRESS, RequestStatus.READY_TO_SHIP, RequestStatus.IN_DELIVERY}
-        and not (u.is_superuser or "director" in user_groups)
+        and to in _WAREHOUSE_TARGET_STATUSES
+        and obj.status not in _WAREHOUSE_ENTRY_STATUSES
+        and not is_privileged
     ):
         return HttpResponseBadRequest("Заявка ещё не передана на склад")
 
     from_status = obj.status
     
-    # ✅ Автоматическое создание PickItem при переходе из APPROVED в TO_PICK
+    # ✅ Автоматическое создание PickItem при переходе из APPROVED в TO_PICK.
+    # Запросы к КП — только после всех проверок прав и только для реального
+    # перехода (повторная отправка из TO_PICK сюда не попадает)
+    created_items = []
     if to == RequestStatus.TO_PICK and from_status == RequestStatus.APPROVED:
         # Проверяем, что есть активное КП
         active_quote = obj.active_quote
@@ -764,7 +838,7 @@ def request_change_status(request, pk: int):
         
         # Автоматически создаем PickItem из товаров КП
         try:
-            created_items = _create_pick_items_from_quote(obj, u)
+            created_items = _create_pick_items_from_quote(obj, u, active_quote)
             if not created_items:
                 return HttpResponseBadRequest("Не удалось создать позиции для сборки")
         except Exception as e:
@@ -781,27 +855,31 @@ def request_change_status(request, pk: int):
     # Создаем запись в истории
     history_note = ""
     if to == RequestStatus.TO_PICK and from_status == RequestStatus.APPROVED:
-        active_quote = obj.active_quote
-        item_count = active_quote.items.count() if active_quote else 0
-        history_note = f"Созданы позиции для сборки из КП ({item_count} позиций)"
+        # по одной позиции сборки на строку КП — пересчитывать КП не нужно
+        history_note = f"Созданы позиции для сборки из КП ({len(created_items)} позиций)"
     elif to == RequestStatus.DELIVERED and getattr(obj, "is_paid", False):
         history_note = "Заявка доставлена и оплачена - автоматически завершена"
     
-    # Если был переход через DELIVERED в DONE, создаем две записи в истории
+    # Если был переход через DELIVERED в DONE, создаем две записи в истории —
+    # обе одним INSERT
     if to == RequestStatus.DELIVERED and final_status == RequestStatus.DONE:
-        # Сначала запись о доставке
-        RequestHistory.objects.create(
-            request=obj, author=u, from_status=from_status, to_status=RequestStatus.DELIVERED, note="Заявка доставлена"
-        )
-        # Затем запись о завершении
-        RequestHistory.objects.create(
-            request=obj, author=u, from_status=RequestStatus.DELIVERED, to_status=RequestStatus.DONE,
-            note="Заявка оплачена - автоматически завершена"
-        )
+        history_rows = [
+            # Сначала запись о доставке
+            RequestHistory(
+                request_id=obj.pk, author_id=u.pk, from_status=from_status,
+                to_status=RequestStatus.DELIVERED, note="Заявка доставлена",
+            ),
+            # Затем запись о завершении
+            RequestHistory(
+                request_id=obj.pk, author_id=u.pk, from_status=RequestStatus.DELIVERED,
+                to_status=RequestStatus.DONE, note="Заявка оплачена - автоматически завершена",
+            ),
+        ]
     else:
-        RequestHistory.objects.create(
-            request=obj, author=u, from_status=from_status, to_status=final_status, note=history_note
-        )
+        history_rows = [RequestHistory(
+            request_id=obj.pk, author_id=u.pk, from_status=from_status, to_status=final_status, note=history_note,
+        )]
+    write_history(*history_rows)
     messages.success(request, "Статус обновлён")
     return redirect("core:request_detail", pk=pk)
 
@@ -828,10 +906,13 @@ def request_upload_quote(request, pk: int):
 @require_POST
 @require_groups("operator", "director")
 def request_delete_quote(request, pk: int, quote_id: int):
-    obj = get_object_or_404(Request, pk=pk)
-    q = get_object_or_404(RequestQuote, pk=quote_id, request=obj)
+    # заявку не грузим — хватает request_id; file нужен сигналу удаления файла
+    q = get_object_or_404(
+        RequestQuote.objects.only("id", "request", "uploaded_by", "file"),
+        pk=quote_id, request_id=pk,
+    )
     if (q.uploaded_by_id != request.user.id) and (
-        not request.user.groups.filter(name="director").exists()
+        "director" not in group_names(request.user)
     ) and (not request.user.is_superuser):
         return HttpResponseBadRequest("Можно удалять только свои файлы")
     q.delete()
@@ -840,13 +921,40 @@ def request_delete_quote(request, pk: int, quote_id: int):
 
 
 # ---------- Просмотр КП ----------
+QUOTE_PREVIEW_BLOCK_SIZE = 64 * 1024
+
+
+@lru_cache(maxsize=64)
+def _ctype_for_ext(ext: str) -> str:
+    # КП приходят в нескольких форматах — guess_type считаем один раз на расширение
+    return guess_type("f" + ext)[0] or "application/pdf"
+
+
+def _quote_preview_last_modified(request, pk: int, quote_id: int):
+    # updated_at меняется и при замене файла — повторное открытие карточки
+    # получает 304 без чтения файла
+    return (
+        RequestQuote.objects.filter(pk=quote_id, request_id=pk)
+        .values_list("updated_at", flat=True).first()
+    )
+
+
 @xframe_options_exempt
+@cache_control(private=True, max_age=300)
+@condition(last_modified_func=_quote_preview_last_modified)
 def request_quote_preview(request, pk: int, quote_id: int):
     q = get_object_or_404(RequestQuote, pk=quote_id, request_id=pk)
     if not q.file:
         raise Http404("Файл не найден")
-    ctype = guess_type(q.original_name or q.file.name)[0] or "application/pdf"
-    resp = FileResponse(q.file.open("rb"), content_type=ctype)
+    ctype = _ctype_for_ext(os.path.splitext(q.original_name or q.file.name)[1].lower())
+    if settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        # файл отдаёт nginx (sendfile), воркер не гоняет его через себя
+        resp = HttpResponse(content_type=ctype)
+        resp["X-Accel-Redirect"] = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + url_quote(q.file.name)
+    else:
+        resp = FileResponse(q.file.open("rb"), content_type=ctype)
+        # PDF КП бывают на несколько МБ — читаем крупными блоками вместо 4 КБ
+        resp.block_size = QUOTE_PREVIEW_BLOCK_SIZE
     resp["Content-Disposition"] = (
         f'inline; filename="{q.original_name or q.file.name}"'
     )
@@ -886,46 +994,52 @@ def request_update_company(request, pk: int):
 # ---------- Смена оплаты ----------
 @require_POST
 @require_groups("operator", "director")
+@transaction.atomic
 def request_toggle_payment(request, pk: int):
-    obj = get_object_or_404(Request, pk=pk)
-    was_paid = obj.is_paid
-    obj.is_paid = "is_paid" in request.POST
-    
-    old_status = obj.status
-    
+    obj = _get_request_minimal(pk, "is_paid")
+    is_paid = "is_paid" in request.POST
+    old_status = new_status = obj.status
+    history_note = ""
+
     # Если заявка доставлена и оплачена - автоматически завершаем
-    if obj.is_paid and obj.status == RequestStatus.DELIVERED:
-        obj.status = RequestStatus.DONE
-        obj.save(update_fields=["is_paid", "status", "updated_at"])
-        RequestHistory.objects.create(
-            request=obj,
-            author=request.user,
-            from_status=old_status,
-            to_status=RequestStatus.DONE,
-            note="Заявка оплачена - автоматически завершена",
-        )
-        messages.success(request, "Заявка оплачена и автоматически завершена")
+    if is_paid and old_status == RequestStatus.DELIVERED:
+        new_status = RequestStatus.DONE
+        history_note = "Заявка оплачена - автоматически завершена"
     # Если снимаем оплату с завершенной заявки - возвращаем в доставленную
-    elif not obj.is_paid and obj.status == RequestStatus.DONE:
-        obj.status = RequestStatus.DELIVERED
-        obj.save(update_fields=["is_paid", "status", "updated_at"])
-        RequestHistory.objects.create(
-            request=obj,
-            author=request.user,
+    elif not is_paid and old_status == RequestStatus.DONE:
+        new_status = RequestStatus.DELIVERED
+        history_note = "Снята отметка об оплате - заявка возвращена в статус «Доставлена»"
+
+    # Один условный UPDATE без save()/сигналов; условие по статусу не даёт
+    # перезаписать смену статуса, сделанную параллельно
+    updated = Request.objects.filter(pk=pk, status=old_status).update(
+        is_paid=is_paid, status=new_status, updated_at=timezone.now(),
+    )
+    if not updated:
+        messages.error(request, "Статус заявки изменился — обновите страницу")
+        return redirect("core:request_detail", pk=pk)
+    # post_save не было — карточки инициатора/исполнителя сбрасываем сами
+    reset_employee_detail_cache(obj.initiator_id, obj.assignee_id)
+
+    if new_status != old_status:
+        write_history(RequestHistory(
+            request_id=pk,
+            author_id=request.user.pk,
             from_status=old_status,
-            to_status=RequestStatus.DELIVERED,
-            note="Снята отметка об оплате - заявка возвращена в статус «Доставлена»",
-        )
+            to_status=new_status,
+            note=history_note,
+        ))
+
+    if new_status == RequestStatus.DONE:
+        messages.success(request, "Заявка оплачена и автоматически завершена")
+    elif new_status != old_status:
         messages.info(request, "Снята отметка об оплате. Заявка возвращена в статус «Доставлена»")
+    elif is_paid:
+        messages.success(request, "Заявка отмечена как оплаченная")
     else:
-        obj.save(update_fields=["is_paid", "updated_at"])
-        if obj.is_paid:
-            messages.success(request, "Заявка отмечена как оплаченная")
-        else:
-            messages.info(request, "Снята отметка об оплате")
-    
-    return redirect("core:request_detail", pk=pk)
+        messages.info(request, "Снята отметка об оплате")
 
+    return redirect("core:request_detail", pk=pk)
 
 # ---------- Создать/редактировать КП с товарами ----------
 @require_groups("operator", "director")
@@ -1152,8 +1266,8 @@ def request_quote_create_edit(request, pk: int, quote_id: int = None):
     is_operator = False
     is_director = False
     if request.user.is_authenticated:
-        is_operator = request.user.groups.filter(name="operator").exists()
-        is_director = request.user.groups.filter(name="director").exists()
+        is_operator = "operator" in group_names(request.user)
+        is_director = "director" in group_names(request.user)
     
     # Сериализуем products_data в JSON для безопасной передачи в JavaScript
     import json
@@ -1309,11 +1423,14 @@ def request_shipment_create(request, pk: int):
 @require_POST
 @require_groups("operator", "director")
 def request_quote_delete(request, pk: int, qpk: int):
-    obj = get_object_or_404(Request, pk=pk)
-    quote = get_object_or_404(RequestQuote, pk=qpk, request=obj)
-    if hasattr(obj, "is_editable") and not obj.is_editable:
+    # КП и признак редактируемости заявки — одним запросом, без загрузки заявки
+    quote = get_object_or_404(
+        RequestQuote.objects.annotate(request_editable=Request.editable_filter("request__")),
+        pk=qpk, request_id=pk,
+    )
+    if not quote.request_editable:
         messages.error(request, "Заявка недоступна для редактирования.")
-        return redirect("core:request_detail", pk=obj.pk)
+        return redirect("core:request_detail", pk=pk)
     try:
         if quote.file:
             quote.file.delete(save=False)
@@ -1321,7 +1438,7 @@ def request_quote_delete(request, pk: int, qpk: int):
         messages.success(request, "Файл удалён.")
     except Exception as e:
         messages.error(request, f"Не удалось удалить файл: {e}")
-    return redirect("core:request_detail", pk=obj.pk)
+    return redirect("core:request_detail", pk=pk)
 
 
 # ---------- API: Загрузка адресов и контактов контрагента ----------
@@ -1344,8 +1461,8 @@ def counterparty_addresses_contacts(request):
         return JsonResponse({"ok": False, "error": "not_found"}, status=404)
 
     # Проверка прав: менеджер видит только своих клиентов
-    is_manager = request.user.groups.filter(name="manager").exists()
-    is_operator_or_director = request.user.groups.filter(name__in=["operator", "director"]).exists()
+    is_manager = "manager" in group_names(request.user)
+    is_operator_or_director = not group_names(request.user).isdisjoint(("operator", "director"))
     
     if is_manager and not request.user.is_superuser and not is_operator_or_director:
         if hasattr(counterparty, "managers"):
@@ -1398,8 +1515,8 @@ def counterparty_add_address(request):
         return JsonResponse({"ok": False, "error": "not_found"}, status=404)
 
     # Проверка прав: оператор/директор или прикрепленный менеджер
-    is_manager = request.user.groups.filter(name="manager").exists()
-    is_operator_or_director = request.user.groups.filter(name__in=["operator", "director"]).exists()
+    is_manager = "manager" in group_names(request.user)
+    is_operator_or_director = not group_names(request.user).isdisjoint(("operator", "director"))
     
     if is_manager and not request.user.is_superuser and not is_operator_or_director:
         if hasattr(counterparty, "managers"):
@@ -1452,8 +1569,8 @@ def counterparty_add_contact(request):
         return JsonResponse({"ok": False, "error": "not_found"}, status=404)
 
     # Проверка прав: оператор/директор или прикрепленный менеджер
-    is_manager = request.user.groups.filter(name="manager").exists()
-    is_operator_or_director = request.user.groups.filter(name__in=["operator", "director"]).exists()
+    is_manager = "manager" in group_names(request.user)
+    is_operator_or_director = not group_names(request.user).isdisjoint(("operator", "director"))
     
     if is_manager and not request.user.is_superuser and not is_operator_or_director:
         if hasattr(counterparty, "managers"):
@@ -9,6 +9,12 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Отдача защищённых файлов (превью КП) через nginx: view отвечает только
+# заголовком X-Accel-Redirect, файл nginx читает с диска сам.
+# Пример: MEDIA_ACCEL_REDIRECT_PREFIX=/protected/ и в nginx
+#   location /protected/ { internal; alias /path/to/media/; }
+# Пусто — файл отдаёт Django (FileResponse)
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX", "")
 
 
 STATICFILES_DIRS = [BASE_DIR / "static"]  # если этой записи нет
@@ -123,6 +129,26 @@ DATABASES = {
     }
 }
 
+# 🗄 КЭШ — общий для всех воркеров gunicorn: карточки сотрудников, stock_lookup,
+# список ролей сбрасываются сигналами, и сброс должен быть виден всем процессам
+# (LocMemCache у каждого процесса свой). REDIS_URL задан — Redis, иначе
+# таблица django_cache в основной БД (создаётся миграцией core 0056).
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+        }
+    }
+
 # Пароли
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},